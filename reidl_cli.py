@@ -0,0 +1,279 @@
+import argparse
+import contextlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from reidl_core import (ReiDLCore, DEFAULT_MAX_WORKERS, DEFAULT_PLATFORM_LIMITS, DEFAULT_PREFETCH_WORKERS,
+                        COLLECTION_VIDEO_QUALITIES, COLLECTION_AUDIO_QUALITIES, get_video_id, get_collection_id, parse_playlist_items, parse_video_quality)
+from reidl_metrics import JsonFileSink, PrometheusSink
+
+AUDIO_PREFERENCES = {
+    'high': "High Quality",
+    'medium': "Medium Quality",
+    'low': "Low Quality",
+}
+
+class EventWriter:
+    def __init__(self, stream=None, json_lines=True):
+        self.stream = stream or sys.stdout
+        self.json_lines = json_lines
+        self._lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        record = {'event': event, 'time': round(time.time(), 3)}
+        record.update(fields)
+
+        if self.json_lines:
+            line = json.dumps(record)
+        else:
+            details = ' '.join(f"{k}={v}" for k, v in fields.items() if v is not None)
+            line = f"[{event}] {details}"
+
+        with self._lock:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+
+    def progress(self, job, snapshot):
+        if snapshot['status'] != 'downloading':
+            return
+
+        percent = snapshot['percent']
+        speed = snapshot['speed']
+        eta = snapshot['eta']
+        self.emit('progress', job=job.id, url=job.url,
+                  downloaded_bytes=snapshot['downloaded_bytes'],
+                  total_bytes=snapshot['total_bytes'] or None,
+                  percent=round(percent, 1) if percent is not None else None,
+                  speed=round(speed) if speed else None,
+                  eta=round(eta) if eta is not None else None)
+
+def read_urls(args):
+    urls = list(args.urls)
+
+    for path in args.input or []:
+        if path == '-':
+            lines = sys.stdin.read().splitlines()
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        urls.extend(lines)
+
+    if not urls and not sys.stdin.isatty():
+        urls.extend(sys.stdin.read().splitlines())
+
+    result = []
+    for url in urls:
+        url = url.strip()
+        if url and not url.startswith('#'):
+            result.append(url)
+    return result
+
+def pick_video_quality(qualities, preference):
+    if not qualities:
+        return None
+    if preference == 'best':
+        return qualities[0]
+    if preference == 'worst':
+        return qualities[-1]
+
+    try:
+        wanted = int(preference.lower().rstrip('p'))
+    except ValueError:
+        return qualities[0]
+
+    for quality in qualities:
+        if parse_video_quality(quality) <= wanted:
+            return quality
+    return qualities[-1]
+
+def pick_audio_quality(qualities, preference):
+    if not qualities:
+        return None
+    label = AUDIO_PREFERENCES.get(preference)
+    if label:
+        for quality in qualities:
+            if label in quality:
+                return quality
+    return qualities[0]
+
+def parse_platform_limit(value):
+    platform, sep, limit = value.partition('=')
+    platform = platform.strip().lower()
+    if not sep or platform not in DEFAULT_PLATFORM_LIMITS:
+        raise argparse.ArgumentTypeError(
+            f"expected PLATFORM=N with PLATFORM one of {', '.join(sorted(DEFAULT_PLATFORM_LIMITS))}")
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid limit: {limit!r}")
+    if limit < 1:
+        raise argparse.ArgumentTypeError("limit must be at least 1")
+    return platform, limit
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='reidl',
+        description="Download YouTube, X/Twitter and TikTok videos without the UI."
+    )
+    parser.add_argument('urls', nargs='*', help="video, playlist, channel or profile URLs to download")
+    parser.add_argument('-i', '--input', action='append', metavar='FILE',
+                        help="read URLs from FILE, one per line ('-' for stdin)")
+    parser.add_argument('-o', '--output', metavar='DIR',
+                        help="download directory (defaults to the configured one)")
+    parser.add_argument('-q', '--video-quality', default='best',
+                        help="best, worst, or a maximum height such as 1080p (default: best)")
+    parser.add_argument('-a', '--audio-quality', default='high',
+                        choices=sorted(AUDIO_PREFERENCES),
+                        help="audio quality (default: high)")
+    parser.add_argument('--items', metavar='SPEC',
+                        help="entries to take from playlists and channels, e.g. 1-50 or 1,3,10: (default: all)")
+    parser.add_argument('-j', '--jobs', type=int,
+                        help=f"concurrent downloads in total, still capped per platform by --platform-limit "
+                             f"(default: configured value or {DEFAULT_MAX_WORKERS})")
+    defaults = ', '.join(f"{platform}={limit}" for platform, limit in sorted(DEFAULT_PLATFORM_LIMITS.items()))
+    parser.add_argument('--platform-limit', action='append', type=parse_platform_limit, metavar='PLATFORM=N',
+                        help=f"concurrent downloads from one platform, can be repeated (default: {defaults})")
+    parser.add_argument('--resolvers', type=int,
+                        help=f"concurrent format lookups (default: configured value or {DEFAULT_PREFETCH_WORKERS})")
+    parser.add_argument('--progress-interval', type=float, default=1.0, metavar='SECONDS',
+                        help="seconds between progress updates (default: 1)")
+    parser.add_argument('--resume', action='store_true',
+                        help="also resume downloads interrupted in an earlier run")
+    parser.add_argument('--text', action='store_true',
+                        help="print plain text events instead of JSON lines")
+    parser.add_argument('--log-level', default='info',
+                        choices=['debug', 'info', 'warning', 'error'],
+                        help="diagnostics written to stderr (default: info)")
+    parser.add_argument('--metrics-file', metavar='FILE',
+                        help="append per-job timings and throughput to FILE as JSON lines")
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help="serve Prometheus-style metrics on http://127.0.0.1:PORT/metrics")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    writer = EventWriter(sys.stdout, json_lines=not args.text)
+
+    logging.basicConfig(level=getattr(logging, args.log_level.upper()), stream=sys.stderr,
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    # Keep stdout clean for events; anything else printed goes to stderr.
+    with contextlib.redirect_stdout(sys.stderr):
+        return run(args, writer)
+
+def run(args, writer):
+    urls = read_urls(args)
+    if not urls and not args.resume:
+        writer.emit('error', message="no URLs given")
+        return 2
+    
+    if args.items:
+        try:
+            parse_playlist_items(args.items)
+        except ValueError as e:
+            writer.emit('error', message=f"invalid --items: {str(e)}")
+            return 2
+
+    core = ReiDLCore(max_workers=args.jobs,
+                     platform_limits=dict(args.platform_limit) if args.platform_limit else None,
+                     progress_hz=1.0 / max(0.05, args.progress_interval))
+    core.progress.add_listener(writer.progress)
+    if args.metrics_file:
+        core.metrics.add_sink(JsonFileSink(args.metrics_file))
+    if args.metrics_port:
+        try:
+            core.metrics.add_sink(PrometheusSink(core.metrics, port=args.metrics_port))
+        except OSError as e:
+            writer.emit('error', message=f"cannot serve metrics on port {args.metrics_port}: {str(e)}")
+            core.close()
+            return 2
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+        core.download_path = os.path.abspath(args.output)
+
+    jobs = []
+    collections = []
+    failed = 0
+
+    def on_done(job):
+        writer.emit('finished', job=job.id, url=job.url, status=job.status,
+                    output=job.output_path if job.success else None,
+                    plan=job.plan, duplicate_of=job.duplicate_of, error=job.error,
+                    error_class=job.error_class, retries=job.retries or None)
+
+    def on_queued(job, estimated_bytes=None):
+        jobs.append(job)
+        writer.emit('queued', job=job.id, url=job.url,
+                    video_quality=job.video_quality, audio_quality=job.audio_quality,
+                    estimated_bytes=estimated_bytes)
+
+    valid_urls = []
+    collection_urls = []
+    for url in urls:
+        if get_video_id(url):
+            valid_urls.append(url)
+        elif get_collection_id(url):
+            collection_urls.append(url)
+        else:
+            failed += 1
+            writer.emit('finished', job=None, url=url, status='failed', error="unsupported URL")
+
+    if args.resume:
+        for job in core.resume_jobs(done_callback=on_done):
+            jobs.append(job)
+            writer.emit('queued', job=job.id, url=job.url, resumed=True,
+                        video_quality=job.video_quality, audio_quality=job.audio_quality,
+                        resumed_bytes=job.resumed_bytes, estimated_bytes=job.total_bytes)
+
+    try:
+        # Collections have no single format list, their entries take the closest generic quality
+        video_quality = pick_video_quality(COLLECTION_VIDEO_QUALITIES, args.video_quality)
+        audio_quality = pick_audio_quality(COLLECTION_AUDIO_QUALITIES, args.audio_quality)
+        for url in collection_urls:
+            collections.append(core.queue_collection(url, video_quality, audio_quality, items=args.items,
+                                                     done_callback=on_done, job_callback=on_queued))
+
+        for url, video_qualities, audio_qualities, error_class in core.prefetch_formats(valid_urls, args.resolvers):
+            if error_class:
+                failed += 1
+                writer.emit('finished', job=None, url=url, status='failed',
+                            error="format lookup failed", error_class=error_class)
+                continue
+            
+            video_quality = pick_video_quality(video_qualities, args.video_quality)
+            audio_quality = pick_audio_quality(audio_qualities, args.audio_quality)
+            if not video_quality or not audio_quality:
+                failed += 1
+                writer.emit('finished', job=None, url=url, status='failed',
+                            error="no downloadable formats")
+                continue
+
+            estimated_bytes = core.estimate_download_size(url, video_quality, audio_quality)
+            on_queued(core.queue_download(url, video_quality, audio_quality,
+                                          done_callback=on_done), estimated_bytes)
+
+        for collection in collections:
+            collection.wait()
+            if collection.error:
+                failed += 1
+                writer.emit('finished', job=None, url=collection.url, status='failed',
+                            error=collection.error)
+
+        for job in jobs:
+            job.wait()
+    except KeyboardInterrupt:
+        writer.emit('interrupted', message="partial downloads kept, run with --resume to continue")
+        core.close()
+        return 130
+
+    core.close()
+    total = failed + len(jobs)
+    failed += sum(1 for job in jobs if not job.success)
+    writer.emit('summary', total=total, completed=total - failed, failed=failed)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+from reidl_storage import user_config_dir
+
+logger = logging.getLogger('reidl.config')
+
+CONFIG_FILENAME = 'config.json'
+# Older versions kept config.json next to the app, never look in the working directory
+LEGACY_CONFIG_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(sys.executable if getattr(sys, 'frozen', False) else __file__)),
+    CONFIG_FILENAME)
+DEFAULT_SAVE_DELAY = 0.5
+
+class ConfigStore:
+    def __init__(self, path=None, save_delay=DEFAULT_SAVE_DELAY):
+        self.path = path or os.path.join(user_config_dir(), CONFIG_FILENAME)
+        self.save_delay = save_delay
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._timer = None
+        self._dirty = False
+        self._data = self._load()
+        atexit.register(self.flush)
+
+    def _load(self):
+        for path in (self.path, LEGACY_CONFIG_PATH):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    if path != self.path:
+                        logger.info(f"Migrating settings from {path}")
+                        self._dirty = True
+                    return data
+            except (FileNotFoundError, json.JSONDecodeError):
+                continue
+            except OSError as e:
+                logger.warning(f"Error reading config {path}: {str(e)}")
+        return {}
+
+    def get(self, key, default=None):
+        with self._lock:
+            return copy.deepcopy(self._data.get(key, default))
+
+    def set(self, key, value):
+        self.update({key: value})
+
+    def update(self, values=None, **kwargs):
+        values = dict(values or {}, **kwargs)
+        with self._lock:
+            for key, value in values.items():
+                self._data[key] = copy.deepcopy(value)
+            self._schedule_save()
+
+    def delete(self, *keys):
+        with self._lock:
+            removed = False
+            for key in keys:
+                if key in self._data:
+                    del self._data[key]
+                    removed = True
+            if removed:
+                self._schedule_save()
+
+    def _schedule_save(self):
+        self._dirty = True
+        if self._timer is None:
+            self._timer = threading.Timer(self.save_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        # Snapshot and replace in one step so an older snapshot can never land after a newer one
+        with self._write_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                if not self._dirty:
+                    return
+                data = json.dumps(self._data, indent=2)
+                self._dirty = False
+
+            try:
+                self._write(data)
+            except OSError as e:
+                logger.error(f"Error saving config: {str(e)}")
+                with self._lock:
+                    self._dirty = True
+
+    def _write(self, data):
+        directory = os.path.dirname(self.path) or '.'
+        fd, temp_path = tempfile.mkstemp(prefix='.config-', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
@@ -1,12 +1,24 @@
-import json
 import os
-import yt_dlp
 import re
-import glob
+import math
+import copy
 import time
 import threading
 import signal
 import sys
+import collections
+import itertools
+import contextlib
+import datetime
+import logging
+from reidl_storage import FormatCache, JobJournal, DownloadArchive, process_alive
+from reidl_config import ConfigStore
+from reidl_formats import FormatTable, estimate_format_size
+from reidl_errors import (RetryPolicy, CircuitBreaker, DEFAULT_BREAKER_THRESHOLD, DEFAULT_BREAKER_RESET,
+                          classify_error, error_host)
+from reidl_metrics import Metrics, create_sink
+
+logger = logging.getLogger('reidl.core')
 
 def get_video_id(url):
     try:
@@ -33,212 +45,1872 @@ def get_video_id(url):
     except:
         return None
 
+def get_collection_id(url):
+    try:
+        if 'youtube.com' in url:
+            if 'v=' in url:
+                return None
+            match = re.search(r'[?&]list=([\w-]+)', url)
+            if match:
+                return {'platform': 'youtube', 'id': match.group(1), 'kind': 'playlist'}
+            match = re.search(r'youtube\.com/((?:@|channel/|c/|user/)[\w.%-]+)', url)
+            if match:
+                return {'platform': 'youtube', 'id': match.group(1), 'kind': 'channel'}
+        elif 'tiktok.com' in url:
+            if '/video/' in url:
+                return None
+            match = re.search(r'tiktok\.com/@([\w.-]+)', url)
+            if match:
+                return {'platform': 'tiktok', 'id': match.group(1), 'kind': 'profile'}
+        return None
+    except:
+        return None
+
+def parse_playlist_items(items):
+    from yt_dlp.utils import PlaylistEntries
+    
+    selection = []
+    for item in PlaylistEntries.parse_playlist_items(items):
+        if isinstance(item, int):
+            item = slice(item, item)
+        start = 1 if item.start is None else item.start
+        stop = math.inf if item.stop is None else item.stop
+        step = item.step or 1
+        if start < 1 or stop < 1 or step < 1:
+            # Counting from the end would need the whole list before the first download
+            raise ValueError(f"Only positive item ranges are supported: {items}")
+        selection.append((start, stop, step))
+    return selection
+
+def item_selected(index, selection):
+    if not selection:
+        return True
+    return any(start <= index <= stop and (index - start) % step == 0
+               for start, stop, step in selection)
+
+DEFAULT_MAX_WORKERS = 4
+
+CPU_COUNT = os.cpu_count() or 2
+DEFAULT_TRANSCODE_WORKERS = max(1, CPU_COUNT // 4)
+DEFAULT_TRANSCODE_THREADS = CPU_COUNT
+DEFAULT_TRANSCODE_PRIORITY = 'low'
+
+def parse_video_quality(video_quality):
+    if "4K" in video_quality:
+        return 2160
+    elif "2K" in video_quality:
+        return 1440
+    elif "1080p" in video_quality:
+        return 1080
+    elif "720p" in video_quality:
+        return 720
+    elif "480p" in video_quality:
+        return 480
+    try:
+        return int(video_quality.split('p')[0])
+    except:
+        return 720
+
+def parse_audio_quality(audio_quality):
+    if "High Quality" in audio_quality:
+        return 160
+    elif "Medium Quality" in audio_quality:
+        return 128
+    return 64
+
+INFO_CACHE_SIZE = 32
+INFO_CACHE_TTL = 20 * 60
+# Queued jobs holding their prefetched info, past this it stays in the LRU and may be extracted again
+INFO_CLAIM_LIMIT = 256
+FORMAT_TABLE_CACHE_SIZE = 256
+
+DEFAULT_FILENAME_TEMPLATE = '{prefix}{counter}.mp4'
+RESERVATION_SUFFIX = '.reserved'
+
+FILENAME_PREFIXES = {
+    'youtube': 'ytdl',
+    'twitter': 'xdl',
+    'tiktok': 'ttkdl',
+}
+
+CLEANUP_RETRY_DELAYS = (0.25, 0.5, 1.0, 2.0, 4.0)
+
+JOURNAL_INTERVAL = 2.0
+
+COLLECTION_VIDEO_QUALITIES = ["4K", "2K", "1080p HD", "720p HD", "480p", "360p"]
+COLLECTION_AUDIO_QUALITIES = ["High Quality Audio", "Medium Quality Audio", "Low Quality Audio"]
+COLLECTION_QUEUE_AHEAD = 50
+MAX_COLLECTION_DEPTH = 3
+
+DUPLICATE_MODES = ('reuse', 'link', 'download')
+
+DEFAULT_POOL_IDLE = 4
+
+DEFAULT_CONCURRENT_FRAGMENTS = 4
+MAX_CONCURRENT_FRAGMENTS = 16
+
+PARALLEL_STREAM_PROTOCOLS = ('http', 'https', 'http_dash_segments')
+
+DEFAULT_CONNECTIONS_PER_HOST = 16
+DEFAULT_CONNECTION_HOSTS = 32
+
+DEFAULT_PREFETCH_WORKERS = 8
+
+# Metadata requests per second per platform, shared by single lookups and bulk prefetches
+DEFAULT_METADATA_RATES = {
+    'youtube': 5,
+    'twitter': 2,
+    'tiktok': 2,
+}
+
+# Longest single sleep while throttling, so cancel and pause are still noticed quickly
+BANDWIDTH_SLEEP_SLICE = 0.25
+
+DEFAULT_PROGRESS_HZ = 10
+DEFAULT_SPEED_SMOOTHING = 0.3
+
+DEFAULT_PLATFORM_LIMITS = {
+    'youtube': 3,
+    'twitter': 2,
+    'tiktok': 2,
+}
+
+def remove_files(paths):
+    deleted = 0
+    remaining = []
+    for path in paths:
+        try:
+            os.remove(path)
+            deleted += 1
+        except FileNotFoundError:
+            pass
+        except OSError:
+            remaining.append(path)
+    return deleted, remaining
+
+class DownloadJob:
+    _ids = itertools.count(1)
+
+    def __init__(self, url, video_quality, audio_quality, progress_callback=None, done_callback=None):
+        self.id = next(DownloadJob._ids)
+        self.url = url
+        self.video_info = get_video_id(url)
+        self.platform = self.video_info['platform'] if self.video_info else None
+        self.video_quality = video_quality
+        self.audio_quality = audio_quality
+        self.progress_callback = progress_callback
+        self.done_callback = done_callback
+        
+        self.status = 'queued'
+        self.output_path = None
+        self.partial_file = None
+        self.artifacts = set()
+        self._fragments = {}
+        self.fragment_workers = 1
+        self.stream_progress = None
+        self.total_bytes = None
+        self.rate_limit = None
+        self.retries = 0
+        self.error_class = None
+        self.created = time.monotonic()
+        self.timings = {}
+        self.download_started = None
+        self.postprocess_started = {}
+        self.plan = None
+        self.journal_id = None
+        self.journal_time = 0
+        self.resumed_bytes = 0
+        self.duplicate_of = None
+        self.reused_info = False
+        self.prefetched_info = None
+        self.success = False
+        self.error = None
+        self._done = threading.Event()
+        self._finished = False
+        self._finish_lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._resume = threading.Event()
+        self._resume.set()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def paused(self):
+        return not self._resume.is_set()
+
+    def pause(self):
+        if not self.cancelled and not self.done:
+            self._resume.clear()
+
+    def resume(self):
+        self._resume.set()
+
+    def cancel(self):
+        self._cancel.set()
+        self._resume.set()
+
+    def wait_while_paused(self):
+        self._resume.wait()
+        return not self.cancelled
+
+    def wait(self, timeout=None):
+        self._done.wait(timeout)
+        return self.success
+
+    def record_download(self, d):
+        filename = d.get('filename')
+        if filename and filename != self.partial_file:
+            self.partial_file = filename
+            self.artifacts.add(filename)
+            self.artifacts.add(filename + '.ytdl')
+        
+        tmpfilename = d.get('tmpfilename')
+        if tmpfilename:
+            self.artifacts.add(tmpfilename)
+            if d.get('fragment_index'):
+                self._fragments[tmpfilename] = max(d['fragment_index'], self._fragments.get(tmpfilename, 0))
+
+    def record_postprocessor(self, d):
+        if d.get('status') != 'started':
+            return
+        
+        from yt_dlp.utils import prepend_extension
+        
+        info = d.get('info_dict') or {}
+        paths = [info.get('filepath')] + list(info.get('__files_to_merge') or [])
+        for path in paths:
+            if path:
+                self.artifacts.add(path)
+                self.artifacts.add(prepend_extension(path, 'temp'))
+
+    def artifact_paths(self):
+        paths = set(self.artifacts)
+        if self.output_path:
+            paths.add(self.output_path)
+        for tmpfilename, last_index in self._fragments.items():
+            # Concurrent workers can have fragments in flight past the last completed one
+            paths.update(f"{tmpfilename}-Frag{index}" for index in range(last_index + 1 + self.fragment_workers))
+        return sorted(paths)
+
+    def finish(self, status, success=False, error=None):
+        # The done event is only set after the callback, so guard re-entry separately
+        with self._finish_lock:
+            if self._finished:
+                return
+            self._finished = True
+        self.status = status
+        self.success = success
+        self.error = error
+        self._resume.set()
+        
+        if self.done_callback:
+            try:
+                self.done_callback(self)
+            except Exception as e:
+                logger.error(f"Error in done callback for job {self.id}: {str(e)}")
+        
+        self._done.set()
+
+class CollectionJob:
+    _ids = itertools.count(1)
+
+    def __init__(self, url, video_quality, audio_quality, items=None):
+        self.id = next(CollectionJob._ids)
+        self.url = url
+        self.collection_info = get_collection_id(url)
+        self.platform = self.collection_info['platform'] if self.collection_info else None
+        self.video_quality = video_quality
+        self.audio_quality = audio_quality
+        self.items = items
+        self.selection = parse_playlist_items(items) if items else None
+        self.last_item = max(stop for _, stop, _ in self.selection) if self.selection else math.inf
+        
+        self.status = 'queued'
+        self.title = None
+        self.jobs = []
+        self.discovered = 0
+        self.error = None
+        self._done = threading.Event()
+        self._cancel = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def wait(self, timeout=None):
+        self._done.wait(timeout)
+        return self.error is None
+
+    def pending(self):
+        return sum(1 for job in self.jobs if job.status == 'queued')
+
+    def finish(self, status, error=None):
+        self.status = status
+        self.error = error
+        self._done.set()
+
+class DownloadQueue:
+    def __init__(self, runner, max_workers=DEFAULT_MAX_WORKERS, platform_limits=None, name='worker',
+                 default_limits=DEFAULT_PLATFORM_LIMITS):
+        self.runner = runner
+        self.name = name
+        self.max_workers = max_workers
+        self.platform_limits = dict(default_limits)
+        if platform_limits:
+            self.platform_limits.update(platform_limits)
+        
+        self._cond = threading.Condition()
+        self._pending = collections.deque()
+        self._running = set()
+        self._active = collections.Counter()
+        self._workers = []
+        self._idle_workers = 0
+        self._shutdown = False
+
+    def submit(self, job):
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("Download queue is shut down")
+            self._pending.append(job)
+            self._spawn_workers()
+            self._cond.notify_all()
+        return job
+
+    def remove(self, job):
+        with self._cond:
+            try:
+                self._pending.remove(job)
+                return True
+            except ValueError:
+                return False
+
+    def set_limits(self, max_workers=None, platform_limits=None):
+        with self._cond:
+            if max_workers is not None:
+                self.max_workers = max(1, int(max_workers))
+            if platform_limits:
+                self.platform_limits.update(platform_limits)
+            self._spawn_workers()
+            self._cond.notify_all()
+
+    def jobs(self):
+        with self._cond:
+            return list(self._running) + list(self._pending)
+
+    def shutdown(self, cancel_pending=True):
+        with self._cond:
+            self._shutdown = True
+            pending = list(self._pending) if cancel_pending else []
+            if cancel_pending:
+                self._pending.clear()
+            self._cond.notify_all()
+        
+        for job in pending:
+            job.cancel()
+            job.finish('cancelled')
+
+    def _spawn_workers(self):
+        wanted = min(self.max_workers, len(self._pending) + len(self._running))
+        while len(self._workers) < wanted and self._idle_workers < len(self._pending):
+            worker = threading.Thread(target=self._worker_loop, daemon=True,
+                                      name=f"reidl-{self.name}-{len(self._workers) + 1}")
+            self._workers.append(worker)
+            self._idle_workers += 1
+            worker.start()
+
+    def _next_job(self):
+        if len(self._running) >= self.max_workers:
+            return None
+        
+        for job in self._pending:
+            limit = self.platform_limits.get(job.platform, self.max_workers)
+            if self._active[job.platform] < limit:
+                self._pending.remove(job)
+                return job
+        return None
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    if self._shutdown:
+                        self._idle_workers -= 1
+                        self._workers.remove(threading.current_thread())
+                        return
+                    self._cond.wait()
+                    job = self._next_job()
+                
+                self._idle_workers -= 1
+                self._running.add(job)
+                self._active[job.platform] += 1
+            
+            try:
+                self.runner(job)
+            except Exception as e:
+                logger.error(f"Unhandled error in job {job.id}: {str(e)}")
+                job.finish('failed', error=str(e))
+            finally:
+                with self._cond:
+                    self._running.discard(job)
+                    self._active[job.platform] -= 1
+                    self._idle_workers += 1
+                    self._cond.notify_all()
+
+class RateLimiter:
+    def __init__(self, rates=None):
+        self.rates = dict(DEFAULT_METADATA_RATES)
+        if rates:
+            self.rates.update(rates)
+        self._lock = threading.Lock()
+        self._next_slot = {}
+
+    def acquire(self, key):
+        rate = self.rates.get(key)
+        if not rate:
+            return
+        
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(key, now))
+            self._next_slot[key] = slot + 1.0 / rate
+        
+        if slot > now:
+            time.sleep(slot - now)
+
+class TokenBucket:
+    def __init__(self, rate=None):
+        self.rate = rate
+        self.allowance = 0.0
+        self.time = time.monotonic()
+
+    def reserve(self, amount, now):
+        if not self.rate:
+            self.allowance = 0.0
+            self.time = now
+            return 0
+        
+        # Allow at most one second of burst after an idle period
+        self.allowance = min(self.rate, self.allowance + (now - self.time) * self.rate)
+        self.time = now
+        self.allowance -= amount
+        return -self.allowance / self.rate if self.allowance < 0 else 0
+
+def parse_schedule(rules):
+    schedule = []
+    for rule in rules or []:
+        start_hour, start_minute = (int(part) for part in rule['start'].split(':'))
+        end_hour, end_minute = (int(part) for part in rule['end'].split(':'))
+        days = rule.get('days')
+        schedule.append({
+            'start': start_hour * 60 + start_minute,
+            'end': end_hour * 60 + end_minute,
+            'days': set(days) if days else None,
+            'limit': rule.get('limit') or None,
+        })
+    return schedule
+
+class BandwidthManager:
+    def __init__(self, limit=None, platform_limits=None, job_limit=None, schedule=None):
+        self._lock = threading.Lock()
+        self.limit = limit or None
+        self.platform_limits = {}
+        self.job_limit = job_limit or None
+        self.schedule = parse_schedule(schedule)
+        self._global = TokenBucket()
+        self._platforms = collections.defaultdict(TokenBucket)
+        self._jobs = {}
+        self._progress = {}
+        if platform_limits:
+            self.set_limits(platform_limits=platform_limits)
+
+    def set_limits(self, limit=False, platform_limits=None, job_limit=False):
+        # False leaves a limit unchanged, None or 0 removes it
+        with self._lock:
+            if limit is not False:
+                self.limit = limit or None
+            if platform_limits is not None:
+                self.platform_limits = {platform: value for platform, value in platform_limits.items() if value}
+            if job_limit is not False:
+                self.job_limit = job_limit or None
+
+    def set_schedule(self, rules):
+        schedule = parse_schedule(rules)
+        with self._lock:
+            self.schedule = schedule
+
+    def current_limit(self, now=None):
+        now = now or datetime.datetime.now()
+        minutes = now.hour * 60 + now.minute
+        for rule in self.schedule:
+            if rule['days'] is not None and now.weekday() not in rule['days']:
+                continue
+            if rule['start'] <= rule['end']:
+                active = rule['start'] <= minutes < rule['end']
+            else:
+                active = minutes >= rule['start'] or minutes < rule['end']
+            if active:
+                return rule['limit']
+        return self.limit
+
+    def throttle(self, job, d):
+        downloaded = d.get('downloaded_bytes') or 0
+        key = (job.id, d.get('filename'))
+        
+        with self._lock:
+            # The first report is only a baseline, resumed files already count the bytes on disk
+            previous = self._progress.get(key, downloaded)
+            self._progress[key] = downloaded
+            amount = downloaded - previous
+            if amount <= 0:
+                return
+            
+            now = time.monotonic()
+            self._global.rate = self.current_limit()
+            platform_bucket = self._platforms[job.platform]
+            platform_bucket.rate = self.platform_limits.get(job.platform)
+            job_bucket = self._jobs.get(job.id)
+            if job_bucket is None:
+                job_bucket = self._jobs[job.id] = TokenBucket()
+            job_bucket.rate = job.rate_limit or self.job_limit
+            
+            delay = max(bucket.reserve(amount, now) for bucket in (self._global, platform_bucket, job_bucket))
+        
+        deadline = time.monotonic() + delay
+        while not job.cancelled:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(remaining, BANDWIDTH_SLEEP_SLICE))
+
+    def release(self, job):
+        with self._lock:
+            self._jobs.pop(job.id, None)
+            for key in [key for key in self._progress if key[0] == job.id]:
+                del self._progress[key]
+
+class StreamProgress:
+    def __init__(self, filename, totals):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._aborted = False
+        self._streams = {path: {'downloaded_bytes': 0, 'total_bytes': total or 0, 'status': 'downloading'}
+                         for path, total in totals.items()}
+
+    def abort(self):
+        self._aborted = True
+
+    def reset(self):
+        self._aborted = False
+
+    def update(self, d):
+        if self._aborted:
+            raise Exception("Stream download aborted")
+        
+        with self._lock:
+            stream = self._streams.get(d.get('filename'))
+            if stream is not None:
+                stream['total_bytes'] = (d.get('total_bytes') or d.get('total_bytes_estimate')
+                                         or stream['total_bytes'])
+                # Streams found already downloaded report only their size
+                stream['downloaded_bytes'] = (d.get('downloaded_bytes')
+                                              or (stream['total_bytes'] if d.get('status') == 'finished' else 0))
+                stream['status'] = d.get('status')
+                stream['speed'] = d.get('speed')
+            streams = list(self._streams.values())
+        
+        return {
+            'status': 'finished' if all(s['status'] == 'finished' for s in streams) else 'downloading',
+            'filename': self.filename,
+            'downloaded_bytes': sum(s['downloaded_bytes'] for s in streams),
+            'total_bytes': sum(s['total_bytes'] for s in streams) if all(s['total_bytes'] for s in streams) else None,
+            'speed': sum(s.get('speed') or 0 for s in streams) or None,
+        }
+
+class ProgressAggregator:
+    def __init__(self, rate_hz=DEFAULT_PROGRESS_HZ, smoothing=DEFAULT_SPEED_SMOOTHING):
+        self.interval = 1.0 / rate_hz
+        self.smoothing = smoothing
+        self._cond = threading.Condition()
+        self._latest = {}
+        self._state = {}
+        self._listeners = []
+        self._thread = None
+
+    def set_rate(self, rate_hz):
+        with self._cond:
+            self.interval = 1.0 / rate_hz
+
+    def add_listener(self, listener):
+        with self._cond:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._cond:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def update(self, job, d):
+        with self._cond:
+            notify = not self._latest
+            self._latest[job.id] = (job, d, time.monotonic())
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name="reidl-progress")
+                self._thread.start()
+            if notify:
+                self._cond.notify()
+
+    def discard(self, job):
+        with self._cond:
+            self._latest.pop(job.id, None)
+            self._state.pop(job.id, None)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._latest:
+                    self._cond.wait()
+                batch = self._latest
+                self._latest = {}
+                listeners = list(self._listeners)
+                interval = self.interval
+                snapshots = [(job, self._snapshot(job, d, ts)) for job, d, ts in batch.values()]
+            
+            for job, snapshot in snapshots:
+                self._deliver(job, snapshot, listeners)
+            
+            time.sleep(interval)
+
+    def _deliver(self, job, snapshot, listeners):
+        if job.done:
+            return
+        
+        if job.progress_callback:
+            try:
+                job.progress_callback(snapshot)
+            except Exception as e:
+                logger.warning(f"Error in progress callback for job {job.id}: {str(e)}")
+        
+        for listener in listeners:
+            try:
+                listener(job, snapshot)
+            except Exception as e:
+                logger.warning(f"Error in progress listener: {str(e)}")
+
+    def _snapshot(self, job, d, ts):
+        downloaded = d.get('downloaded_bytes', 0) or 0
+        total = d.get('total_bytes', 0) or d.get('total_bytes_estimate', 0) or job.total_bytes or 0
+        filename = d.get('filename')
+        
+        state = self._state.get(job.id)
+        if state is None or state['filename'] != filename or downloaded < state['bytes']:
+            state = {'filename': filename, 'bytes': downloaded, 'time': ts, 'speed': None}
+            self._state[job.id] = state
+        elif ts > state['time'] and downloaded > state['bytes']:
+            current = (downloaded - state['bytes']) / (ts - state['time'])
+            if state['speed'] is None:
+                state['speed'] = current
+            else:
+                state['speed'] = self.smoothing * current + (1 - self.smoothing) * state['speed']
+            state['bytes'] = downloaded
+            state['time'] = ts
+        
+        speed = state['speed'] or d.get('speed')
+        if total and speed:
+            eta = max(0, total - downloaded) / speed
+        else:
+            eta = d.get('eta')
+        
+        return {
+            'job_id': job.id,
+            'status': d.get('status'),
+            'filename': filename,
+            'downloaded_bytes': downloaded,
+            'total_bytes': total,
+            'percent': downloaded / total * 100 if total else None,
+            'speed': speed,
+            'eta': eta,
+            'fragment_index': d.get('fragment_index'),
+            'fragment_count': d.get('fragment_count'),
+        }
+
+class FilenameAllocator:
+    def __init__(self, template=DEFAULT_FILENAME_TEMPLATE):
+        self.template = template
+        self._lock = threading.Lock()
+        self._listings = {}
+        self._counters = {}
+
+    def set_template(self, template):
+        with self._lock:
+            self.template = template
+            self._counters.clear()
+
+    def reserve(self, directory, platform, video_id=None):
+        pattern = self._render(platform, video_id)
+        key = (os.path.normcase(os.path.abspath(directory)), pattern)
+        
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None:
+                counter = self._seed(directory, key[0], pattern)
+            
+            while True:
+                filename = pattern.replace('{counter}', str(counter) if counter > 0 else '')
+                path = os.path.join(directory, filename)
+                if not self._lock_name(path):
+                    counter += 1
+                    continue
+                try:
+                    fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                    os.close(fd)
+                    self._counters[key] = counter + 1
+                    return path
+                except FileExistsError:
+                    self.unlock(path)
+                    counter += 1
+                except OSError:
+                    self.unlock(path)
+                    raise
+
+    def claim(self, path):
+        # Re-reserve a name handed out earlier, e.g. for a download resumed after a restart
+        try:
+            if not self._lock_name(path):
+                logger.warning(f"{path} is reserved by another running download")
+            fd = os.open(path, os.O_CREAT | os.O_WRONLY)
+            os.close(fd)
+        except OSError as e:
+            logger.warning(f"Could not reserve {path}: {str(e)}")
+
+    def release(self, path):
+        self.unlock(path)
+        try:
+            if os.path.getsize(path) == 0:
+                os.remove(path)
+        except OSError:
+            pass
+
+    def unlock(self, path):
+        if not path:
+            return
+        try:
+            os.remove(path + RESERVATION_SUFFIX)
+        except OSError:
+            pass
+
+    def _lock_name(self, path):
+        # yt-dlp deletes the empty placeholder when it starts writing, the sidecar holds the name until the job ends
+        lock_path = path + RESERVATION_SUFFIX
+        for _ in range(2):
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if not self._stale_lock(lock_path):
+                    return False
+                try:
+                    os.remove(lock_path)
+                except OSError:
+                    return False
+                continue
+            with os.fdopen(fd, 'w') as f:
+                f.write(str(os.getpid()))
+            return True
+        return False
+
+    def _stale_lock(self, lock_path):
+        try:
+            with open(lock_path, 'r') as f:
+                pid = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return False
+        return not process_alive(pid)
+
+    def _render(self, platform, video_id):
+        template = self.template
+        if '{counter}' not in template:
+            stem, ext = os.path.splitext(template)
+            template = stem + '{counter}' + ext
+        
+        fields = {
+            'prefix': FILENAME_PREFIXES.get(platform, 'dl'),
+            'platform': platform or 'video',
+            'id': video_id or '',
+            'date': time.strftime('%Y%m%d'),
+            'counter': '{counter}',
+        }
+        return template.format(**fields)
+
+    def _seed(self, directory, directory_key, pattern):
+        names = self._listings.get(directory_key)
+        if names is None:
+            try:
+                with os.scandir(directory) as entries:
+                    names = [entry.name for entry in entries]
+            except OSError:
+                names = []
+            self._listings[directory_key] = names
+        
+        before, after = pattern.split('{counter}', 1)
+        regex = re.compile(re.escape(before) + r'(\d*)' + re.escape(after)
+                           + r'(?:' + re.escape(RESERVATION_SUFFIX) + r')?$')
+        
+        highest = -1
+        for name in names:
+            match = regex.match(name)
+            if match:
+                highest = max(highest, int(match.group(1) or 0))
+        return highest + 1
+
+class SharedNetwork:
+    def __init__(self, connections_per_host=DEFAULT_CONNECTIONS_PER_HOST,
+                 max_hosts=DEFAULT_CONNECTION_HOSTS, block_per_host=False):
+        self.connections_per_host = connections_per_host
+        self.max_hosts = max_hosts
+        self.block_per_host = block_per_host
+        self._lock = threading.Lock()
+        self._director = None
+        self._cookiejar = None
+
+    def attach(self, ydl):
+        with self._lock:
+            if self._director is None:
+                self._cookiejar = ydl.cookiejar
+                self._director = ydl._request_director
+                self._configure(self._director)
+
+            ydl.__dict__['cookiejar'] = self._cookiejar
+            ydl.__dict__['_request_director'] = self._director
+
+    def detach(self, ydl):
+        ydl.__dict__.pop('_request_director', None)
+
+    def _configure(self, director):
+        handler = director.handlers.get('Requests')
+        if handler is None:
+            logger.warning("The 'requests' package is not installed, HTTP connections will not be kept alive")
+            return
+
+        try:
+            session = handler._get_instance(cookiejar=handler.cookiejar, legacy_ssl_support=None)
+            for adapter in {id(a): a for a in session.adapters.values()}.values():
+                adapter.init_poolmanager(self.max_hosts, self.connections_per_host,
+                                         block=self.block_per_host)
+        except Exception as e:
+            logger.warning(f"Could not configure connection pool: {str(e)}")
+
+    def close(self):
+        with self._lock:
+            if self._director is not None:
+                self._director.close()
+                self._director = None
+                self._cookiejar = None
+
+class YoutubeDLPool:
+    def __init__(self, options_factory, max_idle=DEFAULT_POOL_IDLE, network=None):
+        self.options_factory = options_factory
+        self.max_idle = max_idle
+        self.network = network
+        self._lock = threading.Lock()
+        self._idle = collections.defaultdict(list)
+        self._generation = 0
+
+    def _create(self, key):
+        import yt_dlp
+        
+        hooks = {'progress': None, 'postprocessor': None}
+        
+        def progress_hook(d):
+            hook = hooks['progress']
+            if hook:
+                hook(d)
+        
+        def postprocessor_hook(d):
+            hook = hooks['postprocessor']
+            if hook:
+                hook(d)
+        
+        ydl_opts = self.options_factory(*key)
+        ydl_opts['progress_hooks'] = [progress_hook]
+        ydl_opts['postprocessor_hooks'] = [postprocessor_hook]
+        
+        ydl = yt_dlp.YoutubeDL(ydl_opts)
+        ydl._reidl_hooks = hooks
+        ydl._reidl_generation = self._generation
+        ydl._reidl_defaults = {
+            'postprocessors': list(ydl._pps['post_process']),
+            'merge_output_format': ydl.params.get('merge_output_format'),
+            'format': ydl.params.get('format'),
+            'format_selector': ydl.format_selector,
+            'outtmpl': dict(ydl.params['outtmpl']),
+        }
+        if self.network:
+            self.network.attach(ydl)
+        return ydl
+
+    def warm(self, *keys):
+        for key in keys:
+            with self._lock:
+                if self._idle[key]:
+                    continue
+            self._release(key, self._create(key))
+
+    @contextlib.contextmanager
+    def checkout(self, profile, platform, format=None, outtmpl=None,
+                 progress_hook=None, postprocessor_hook=None):
+        key = (profile, platform)
+        with self._lock:
+            ydl = self._idle[key].pop() if self._idle[key] else None
+        if ydl is None:
+            ydl = self._create(key)
+        
+        ydl._download_retcode = 0
+        if format is not None:
+            # YoutubeDL compiles the selector once in __init__, setting params['format'] alone is ignored
+            ydl.params['format'] = format
+            ydl.format_selector = ydl.build_format_selector(format)
+        if outtmpl is not None:
+            ydl.params['outtmpl']['default'] = outtmpl
+        ydl._reidl_hooks['progress'] = progress_hook
+        ydl._reidl_hooks['postprocessor'] = postprocessor_hook
+        
+        healthy = False
+        try:
+            yield ydl
+            healthy = ydl._download_retcode == 0
+        finally:
+            ydl._reidl_hooks['progress'] = None
+            ydl._reidl_hooks['postprocessor'] = None
+            ydl._pps['post_process'][:] = ydl._reidl_defaults['postprocessors']
+            ydl.params['merge_output_format'] = ydl._reidl_defaults['merge_output_format']
+            ydl.params['format'] = ydl._reidl_defaults['format']
+            ydl.format_selector = ydl._reidl_defaults['format_selector']
+            ydl.params['outtmpl'] = dict(ydl._reidl_defaults['outtmpl'])
+            if healthy:
+                self._release(key, ydl)
+            else:
+                self._close(ydl)
+
+    def _release(self, key, ydl):
+        with self._lock:
+            if ydl._reidl_generation == self._generation and len(self._idle[key]) < self.max_idle:
+                self._idle[key].append(ydl)
+                return
+        self._close(ydl)
+
+    def _close(self, ydl):
+        if self.network:
+            self.network.detach(ydl)
+        try:
+            ydl.close()
+        except Exception as e:
+            logger.warning(f"Error closing YoutubeDL instance: {str(e)}")
+
+    def reset(self):
+        # Instances checked out now are closed instead of returned once they finish
+        with self._lock:
+            self._generation += 1
+        self.close()
+
+    def close(self):
+        with self._lock:
+            idle = [ydl for instances in self._idle.values() for ydl in instances]
+            self._idle.clear()
+        for ydl in idle:
+            self._close(ydl)
+
 class ReiDLCore:
-    def __init__(self):
+    def __init__(self, max_workers=None, platform_limits=None, progress_hz=DEFAULT_PROGRESS_HZ,
+                 filename_template=None, config=None, concurrent_fragments=None, split_ranges=None,
+                 parallel_streams=None, transcode=None):
+        self.config = config or ConfigStore()
         self.download_path = self.load_download_path()
+        
+        if max_workers is None:
+            max_workers = self.config.get('max_workers', DEFAULT_MAX_WORKERS)
+        if platform_limits is None:
+            platform_limits = self.config.get('platform_limits')
+        if filename_template is None:
+            filename_template = self.config.get('filename_template', DEFAULT_FILENAME_TEMPLATE)
+        if concurrent_fragments is None:
+            concurrent_fragments = self.config.get('concurrent_fragments', DEFAULT_CONCURRENT_FRAGMENTS)
+        if split_ranges is None:
+            split_ranges = self.config.get('split_ranges', True)
+        if parallel_streams is None:
+            parallel_streams = self.config.get('parallel_streams', True)
+        if transcode is None:
+            transcode = self.config.get('transcode', False)
+        
+        transcode_workers = self.config.get('transcode_workers', DEFAULT_TRANSCODE_WORKERS)
+        self.transcode_threads = self.config.get('transcode_threads', DEFAULT_TRANSCODE_THREADS)
+        self.transcode_priority = self.config.get('transcode_priority', DEFAULT_TRANSCODE_PRIORITY)
+        
         self.base_ydl_opts = {
             'quiet': True,
             'no_warnings': True,
         }
-        self.current_download = None
+        self.preload_time = None
+        self.concurrent_fragments = max(1, min(MAX_CONCURRENT_FRAGMENTS, int(concurrent_fragments)))
+        self.split_ranges = bool(split_ranges)
+        self.parallel_streams = bool(parallel_streams)
+        self.transcode = bool(transcode)
+        self.queue = DownloadQueue(self._run_job, max_workers, platform_limits)
+        # Per-platform caps throttle network requests; CPU-bound transcodes only share the worker count
+        self.transcodes = DownloadQueue(self._run_transcode, transcode_workers, name='transcode',
+                                        default_limits={})
+        self.progress = ProgressAggregator(progress_hz)
+        self.progress.add_listener(self._journal_progress)
+        self.format_cache = self._open_format_cache()
+        self.metrics = Metrics()
+        for spec in self.config.get('metrics_sinks', []):
+            try:
+                self.metrics.add_sink(create_sink(spec, self.metrics))
+            except Exception as e:
+                logger.warning(f"Could not start metrics sink {spec}: {str(e)}")
+        self.metadata_limiter = RateLimiter(self.config.get('metadata_rate_limits'))
+        self.retry_policy = RetryPolicy(self.config.get('retry_policies'))
+        self.breaker = CircuitBreaker(
+            threshold=self.config.get('breaker_threshold', DEFAULT_BREAKER_THRESHOLD),
+            reset_after=self.config.get('breaker_reset', DEFAULT_BREAKER_RESET)
+        )
+        self.bandwidth = BandwidthManager(
+            limit=self.config.get('bandwidth_limit'),
+            platform_limits=self.config.get('bandwidth_platform_limits'),
+            job_limit=self.config.get('bandwidth_job_limit'),
+            schedule=self.config.get('bandwidth_schedule')
+        )
+        self.journal = self._open_journal()
+        self.archive = self._open_archive()
+        self.duplicate_mode = self.config.get('duplicate_mode', 'reuse')
+        self._closing = False
+        self._collections = set()
+        self._collections_lock = threading.Lock()
+        self._info_cache = collections.OrderedDict()
+        self._claimed_info = 0
+        self._format_tables = collections.OrderedDict()
+        self._info_lock = threading.Lock()
+        self.filenames = FilenameAllocator(filename_template)
+        self.network = SharedNetwork(
+            connections_per_host=self.config.get('connections_per_host', DEFAULT_CONNECTIONS_PER_HOST),
+            block_per_host=self.config.get('limit_connections_per_host', False)
+        )
+        self.ydl_pool = YoutubeDLPool(self._ydl_options, max_idle=max(DEFAULT_POOL_IDLE, max_workers),
+                                      network=self.network)
 
-    def load_download_path(self):
+    def preload(self):
+        def load():
+            started = time.perf_counter()
+            try:
+                self.ydl_pool.warm(
+                    ('metadata', 'youtube'),
+                    ('download', 'youtube'),
+                    ('metadata', 'twitter'),
+                    ('metadata', 'tiktok'),
+                )
+            except Exception as e:
+                logger.warning(f"Error preloading yt-dlp: {str(e)}")
+            self.preload_time = time.perf_counter() - started
+        
+        thread = threading.Thread(target=load, daemon=True, name="reidl-preload")
+        thread.start()
+        return thread
+
+    def _open_format_cache(self):
         try:
-            with open('config.json', 'r') as f:
-                config = json.load(f)
-                return config.get('download_path', os.path.expanduser("~/Downloads"))
-        except (FileNotFoundError, json.JSONDecodeError):
-            return os.path.expanduser("~/Downloads")
+            return FormatCache()
+        except Exception as e:
+            logger.warning(f"Format cache unavailable: {str(e)}")
+            return None
 
-    def save_download_path(self, path):
-        self.download_path = path
+    def _open_journal(self):
+        try:
+            return JobJournal()
+        except Exception as e:
+            logger.warning(f"Job journal unavailable: {str(e)}")
+            return None
+
+    def _open_archive(self):
+        try:
+            return DownloadArchive()
+        except Exception as e:
+            logger.warning(f"Download archive unavailable: {str(e)}")
+            return None
+
+    def _archive_key(self, job):
+        if job.platform in ('twitter', 'tiktok'):
+            quality = 'best'
+        else:
+            quality = f"{parse_video_quality(job.video_quality)}p/{parse_audio_quality(job.audio_quality)}k"
+        if self.transcode:
+            quality += '/h264'
+        return job.platform, job.video_info['id'], quality
+
+    def _reuse_download(self, job):
+        if not self.archive or self.duplicate_mode == 'download' or job.output_path:
+            return False
         
-        config = {}
         try:
-            with open('config.json', 'r') as f:
-                config = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            pass
+            existing = self.archive.find(*self._archive_key(job))
+        except Exception as e:
+            logger.warning(f"Error reading download archive: {str(e)}")
+            return False
+        self.metrics.cache('archive', bool(existing))
+        if not existing:
+            return False
         
-        config['download_path'] = path
+        job.duplicate_of = existing
+        job.output_path = existing
+        same_folder = os.path.normcase(os.path.dirname(existing)) == os.path.normcase(os.path.abspath(self.download_path))
+        if self.duplicate_mode == 'link' and not same_folder:
+            path = None
+            try:
+                path = self.filenames.reserve(self.download_path, job.platform, job.video_info['id'])
+                os.remove(path)
+                os.link(existing, path)
+                job.output_path = path
+            except OSError as e:
+                self.filenames.unlock(path)
+                logger.warning(f"Could not link {existing}, reusing it in place: {str(e)}")
         
-        with open('config.json', 'w') as f:
-            json.dump(config, f)
+        logger.info(f"Job {job.id} already downloaded as {existing}")
+        job.finish('completed', success=True)
+        return True
 
-    def get_next_available_filename(self, platform):
-        base_name = {
-            'youtube': 'ytdl',
-            'twitter': 'xdl',
-            'tiktok': 'ttkdl'
-        }.get(platform, 'dl')
+    def _complete(self, job):
+        if self.archive:
+            try:
+                self.archive.add(*self._archive_key(job), job.output_path)
+            except Exception as e:
+                logger.warning(f"Error writing download archive: {str(e)}")
+        job.finish('completed', success=True)
+
+    def _journal_update(self, job, **fields):
+        if not self.journal or job.journal_id is None:
+            return
+        try:
+            self.journal.update(job.journal_id, **fields)
+        except Exception as e:
+            logger.warning(f"Error updating job journal: {str(e)}")
+
+    def _journal_progress(self, job, snapshot):
+        now = time.monotonic()
+        if job.journal_id is None or now - job.journal_time < JOURNAL_INTERVAL:
+            return
+        job.journal_time = now
+        self._journal_update(job, status=job.status,
+                             downloaded_bytes=snapshot['downloaded_bytes'],
+                             total_bytes=snapshot['total_bytes'] or None)
+
+    def _journal_done(self, job):
+        if not self.journal or job.journal_id is None:
+            return
+        if self._closing and job.status == 'cancelled':
+            # Interrupted by shutdown rather than the user, keep it for the next start
+            return
+        try:
+            self.journal.remove(job.journal_id)
+        except Exception as e:
+            logger.warning(f"Error updating job journal: {str(e)}")
+
+    def _submit(self, job):
+        done_callback = job.done_callback
         
-        existing_files = os.listdir(self.download_path)
-        counter = 0
+        def on_done(job):
+            # The name stays reserved across the download, merge and transcode, only now is it free
+            self.filenames.unlock(job.output_path)
+            self.metrics.job_finished(job)
+            self._journal_done(job)
+            self._release_info(job)
+            if done_callback:
+                done_callback(job)
         
-        while True:
-            filename = f"{base_name}{counter if counter > 0 else ''}.mp4"
-            if filename not in existing_files:
-                return filename
-            counter += 1
+        job.done_callback = on_done
+        if self.journal and job.journal_id is None:
+            try:
+                job.journal_id = self.journal.add(job.url, job.platform, job.video_info['id'],
+                                                  job.video_quality, job.audio_quality)
+            except Exception as e:
+                logger.warning(f"Error writing job journal: {str(e)}")
+        return self.queue.submit(job)
+
+    def resume_jobs(self, progress_callback=None, done_callback=None):
+        if not self.journal:
+            return []
+        
+        try:
+            entries = self.journal.entries()
+        except Exception as e:
+            logger.warning(f"Error reading job journal: {str(e)}")
+            return []
+        
+        active = {job.journal_id for job in self.active_jobs()}
+        jobs = []
+        for entry in entries:
+            owner = entry['owner']
+            if entry['id'] in active or (owner != os.getpid() and process_alive(owner)):
+                # Still running here or in another reiDL process sharing the journal
+                continue
+            if not self.journal.claim(entry['id'], owner):
+                continue
+            
+            job = DownloadJob(entry['url'], entry['video_quality'], entry['audio_quality'],
+                              progress_callback, done_callback)
+            job.journal_id = entry['id']
+            if not job.video_info:
+                self._journal_done(job)
+                continue
+            
+            job.output_path = entry['output_path']
+            job.resumed_bytes = entry['downloaded_bytes'] or 0
+            job.total_bytes = entry['total_bytes'] or None
+            if job.resumed_bytes:
+                self.metrics.inc('resumed_bytes_total', job.resumed_bytes, platform=job.platform)
+            logger.info(f"Resuming {job.url} ({entry['downloaded_bytes'] / 1024 / 1024:.1f}MB done)")
+            jobs.append(self._submit(job))
+        return jobs
+
+    def load_download_path(self):
+        return self.config.get('download_path', os.path.expanduser("~/Downloads"))
+
+    def save_download_path(self, path):
+        self.download_path = path
+        self.config.set('download_path', path)
+
+    def set_download_connections(self, concurrent_fragments=None, split_ranges=None, parallel_streams=None):
+        if concurrent_fragments is not None:
+            self.concurrent_fragments = max(1, min(MAX_CONCURRENT_FRAGMENTS, int(concurrent_fragments)))
+            self.config.set('concurrent_fragments', self.concurrent_fragments)
+        if split_ranges is not None:
+            self.split_ranges = bool(split_ranges)
+            self.config.set('split_ranges', self.split_ranges)
+        if parallel_streams is not None:
+            self.parallel_streams = bool(parallel_streams)
+            self.config.set('parallel_streams', self.parallel_streams)
+        self.ydl_pool.reset()
+
+    def set_bandwidth_limits(self, limit=False, platform_limits=None, job_limit=False):
+        self.bandwidth.set_limits(limit, platform_limits, job_limit)
+        if limit is not False:
+            self.config.set('bandwidth_limit', self.bandwidth.limit)
+        if platform_limits is not None:
+            self.config.set('bandwidth_platform_limits', self.bandwidth.platform_limits)
+        if job_limit is not False:
+            self.config.set('bandwidth_job_limit', self.bandwidth.job_limit)
+
+    def set_bandwidth_schedule(self, rules):
+        self.bandwidth.set_schedule(rules)
+        self.config.set('bandwidth_schedule', rules or [])
+
+    def set_job_rate_limit(self, job, limit):
+        job.rate_limit = limit or None
+
+    def set_duplicate_mode(self, mode):
+        if mode not in DUPLICATE_MODES:
+            raise ValueError(f"Unknown duplicate mode: {mode}")
+        self.duplicate_mode = mode
+        self.config.set('duplicate_mode', mode)
+
+    def set_transcode(self, enabled):
+        self.transcode = bool(enabled)
+        self.config.set('transcode', self.transcode)
+
+    def set_transcode_budget(self, workers=None, threads=None, priority=None):
+        if workers is not None:
+            self.transcodes.set_limits(max_workers=workers)
+            self.config.set('transcode_workers', self.transcodes.max_workers)
+        if threads is not None:
+            self.transcode_threads = max(1, int(threads))
+            self.config.set('transcode_threads', self.transcode_threads)
+        if priority is not None:
+            self.transcode_priority = 'low' if priority == 'low' else 'normal'
+            self.config.set('transcode_priority', self.transcode_priority)
 
     def get_video_formats(self, url):
         video_info = get_video_id(url)
         if not video_info:
             return None, None
+        
+        cached = self._cached_video_formats(video_info)
+        if cached:
+            return cached
+        return self._fetch_video_formats(url, video_info)[:2]
+
+    def prefetch_formats(self, urls, max_workers=None):
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        
+        if max_workers is None:
+            max_workers = self.config.get('prefetch_workers', DEFAULT_PREFETCH_WORKERS)
+        
+        waiting = collections.OrderedDict()
+        for url in urls:
+            video_info = get_video_id(url)
+            if not video_info:
+                yield url, None, None, 'permanent'
+                continue
+            key = (video_info['platform'], video_info['id'])
+            if key in waiting:
+                waiting[key][1].append(url)
+            else:
+                waiting[key] = (video_info, [url])
+        
+        def resolve(video_info, url):
+            cached = self._cached_video_formats(video_info)
+            if cached:
+                return cached + (None,)
+            return self._fetch_video_formats(url, video_info)
+        
+        executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='reidl-prefetch')
+        by_platform = collections.defaultdict(list)
+        for video_info, same_video in waiting.values():
+            by_platform[video_info['platform']].append((video_info, same_video))
+        
+        futures = {}
+        try:
+            # Interleave platforms so workers waiting on one platform's rate limit don't hold up the others
+            for batch in itertools.zip_longest(*by_platform.values()):
+                for video_info, same_video in filter(None, batch):
+                    futures[executor.submit(resolve, video_info, same_video[0])] = same_video
             
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': False,
-            'format': 'best',
-            'youtube_include_dash_manifest': True,
-            'nocheckcertificate': True,
-        }
+            for future in as_completed(futures):
+                video_qualities, audio_qualities, error_class = future.result()
+                for url in futures[future]:
+                    yield url, video_qualities, audio_qualities, error_class
+        finally:
+            # The caller may stop early, drop whatever has not started yet
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def estimate_download_size(self, url, video_quality, audio_quality):
+        video_info = get_video_id(url)
+        if not video_info or video_info['platform'] in ['twitter', 'tiktok']:
+            return None
         
+        table = self._format_table(video_info)
+        if table is None and not self._cached_video_formats(video_info):
+            self._fetch_video_formats(url, video_info)
+            table = self._format_table(video_info)
+        return table.estimate(video_quality, audio_quality) if table is not None else None
+
+    def _cached_video_formats(self, video_info):
+        if not self.format_cache:
+            return None
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                formats = info.get('formats', [])
-                
-                if video_info['platform'] in ['twitter', 'tiktok']:
-                    return ["Best Quality"], ["Original Audio"]
+            cached = self.format_cache.get(video_info['platform'], video_info['id'])
+            self.metrics.cache('format', bool(cached))
+            if cached:
+                return cached['video'], cached['audio']
+        except Exception as e:
+            logger.warning(f"Error reading format cache: {str(e)}")
+        return None
 
-                if not formats and 'format_id' in info:
-                    formats = [info]
+    def _fetch_video_formats(self, url, video_info):
+        host = error_host(url)
+        attempt = 0
+        while True:
+            self._wait_for_host(host)
+            self.metadata_limiter.acquire(video_info['platform'])
+            started = time.monotonic()
+            try:
+                video_qualities, audio_qualities, table = self._extract_video_formats(url, video_info)
+                self.breaker.record_success(host)
+                self.metrics.observe('metadata_seconds', time.monotonic() - started, platform=video_info['platform'])
+                break
+            except Exception as e:
+                error_class = classify_error(e)
+                self.metrics.inc('metadata_errors_total', platform=video_info['platform'], error_class=error_class)
+                self._record_failure(host, error_class)
+                delay = self.retry_policy.delay(error_class, attempt)
+                if delay is None:
+                    logger.error(f"Error getting formats ({error_class}): {str(e)}")
+                    return None, None, error_class
+                attempt += 1
+                self.metrics.inc('retries_total', platform=video_info['platform'], error_class=error_class)
+                logger.warning(f"Error getting formats ({error_class}), retry {attempt} in {delay:.1f}s: {str(e)}")
+                time.sleep(delay)
+        
+        if table is not None:
+            self._remember_table(video_info, table)
+        
+        if self.format_cache:
+            try:
+                self.format_cache.put(video_info['platform'], video_info['id'],
+                                      {'video': video_qualities, 'audio': audio_qualities,
+                                       'table': table.to_dict() if table is not None else None})
+            except Exception as e:
+                logger.warning(f"Error writing format cache: {str(e)}")
+        
+        return video_qualities, audio_qualities, None
 
-                video_formats = []
-                seen_resolutions = set()
-                audio_formats = []
-                
-                if not formats:
-                    return ["720p HD", "480p", "360p"], ["High Quality Audio", "Medium Quality Audio"]
-                
-                for f in formats:
-                    vcodec = f.get('vcodec', '')
-                    if vcodec != 'none' and vcodec is not None:
-                        height = f.get('height', 0) or 0
-                        fps = f.get('fps', 0) or 0
-                        filesize = f.get('filesize', 0) or f.get('filesize_approx', 0) or 0
-                        
-                        if height > 0 and height not in seen_resolutions:  
-                            seen_resolutions.add(height)
-                            
-                            if height >= 2160:
-                                quality = "4K"
-                            elif height >= 1440:
-                                quality = "2K"
-                            elif height >= 1080:
-                                quality = "1080p HD"
-                            elif height >= 720:
-                                quality = "720p HD"
-                            elif height >= 480:
-                                quality = "480p"
-                            else:
-                                quality = f"{height}p"
-                            
-                            if filesize > 0:
-                                size_mb = filesize / (1024 * 1024)
-                                if size_mb >= 1024:
-                                    quality += f" (~{size_mb/1024:.1f}GB)"
-                                else:
-                                    quality += f" (~{size_mb:.0f}MB)"
-                            
-                            video_formats.append({
-                                'quality': quality,
-                                'height': height,
-                                'fps': fps,
-                                'format_id': f.get('format_id', '')
-                            })
-                    
-                    acodec = f.get('acodec', '')
-                    if acodec != 'none' and acodec is not None:
-                        abr = f.get('abr', 0) or 0
-                        
-                        if abr > 0:
-                            if abr >= 160:
-                                quality = "High Quality Audio"
-                            elif abr >= 128:
-                                quality = "Medium Quality Audio"
-                            else:
-                                quality = "Low Quality Audio"
-                            
-                            audio_formats.append({
-                                'quality': quality,
-                                'abr': abr,
-                                'format_id': f.get('format_id', '')
-                            })
-                
-                if not video_formats:
-                    video_formats = [
-                        {'quality': '720p HD', 'height': 720, 'fps': 30, 'format_id': 'best[height<=720]'},
-                        {'quality': '480p', 'height': 480, 'fps': 30, 'format_id': 'best[height<=480]'},
-                        {'quality': '360p', 'height': 360, 'fps': 30, 'format_id': 'best[height<=360]'}
-                    ]
-                
-                if not audio_formats:
-                    audio_formats = [
-                        {'quality': 'High Quality Audio', 'abr': 160, 'format_id': 'bestaudio'},
-                        {'quality': 'Medium Quality Audio', 'abr': 128, 'format_id': 'bestaudio[abr<=128]'}
-                    ]
-                
-                video_formats.sort(key=lambda x: x['height'], reverse=True)
-                audio_formats.sort(key=lambda x: x['abr'], reverse=True)
-                
-                video_qualities = []
-                seen_video = set()
-                for f in video_formats:
-                    if f['quality'] not in seen_video:
-                        seen_video.add(f['quality'])
-                        video_qualities.append(f['quality'])
-                
-                audio_qualities = []
-                seen_audio = set()
-                for f in audio_formats:
-                    if f['quality'] not in seen_audio:
-                        seen_audio.add(f['quality'])
-                        audio_qualities.append(f['quality'])
-                
-                return video_qualities, audio_qualities
-                
+    def _extract_video_formats(self, url, video_info):
+        with self.ydl_pool.checkout('metadata', video_info['platform']) as ydl:
+            info = ydl.extract_info(url, download=False)
+            self._remember_info(video_info, ydl.sanitize_info(info, remove_private_keys=True))
+        
+        if video_info['platform'] in ['twitter', 'tiktok']:
+            return ["Best Quality"], ["Original Audio"], None
+        
+        formats = info.get('formats') or []
+        if not formats and 'format_id' in info:
+            formats = [info]
+        
+        table = FormatTable.from_formats(formats, info.get('duration'))
+        video_qualities = table.video_labels() or ["720p HD", "480p", "360p"]
+        audio_qualities = table.audio_labels() or ["High Quality Audio", "Medium Quality Audio"]
+        return video_qualities, audio_qualities, table
+
+    def _remember_table(self, video_info, table):
+        key = (video_info['platform'], video_info['id'])
+        with self._info_lock:
+            self._format_tables[key] = table
+            self._format_tables.move_to_end(key)
+            while len(self._format_tables) > FORMAT_TABLE_CACHE_SIZE:
+                self._format_tables.popitem(last=False)
+
+    def _format_table(self, video_info):
+        key = (video_info['platform'], video_info['id'])
+        with self._info_lock:
+            table = self._format_tables.get(key)
+        if table is not None or not self.format_cache:
+            return table
+        
+        try:
+            cached = self.format_cache.get(*key)
+            if cached and cached.get('table'):
+                table = FormatTable(cached['table'])
+                self._remember_table(video_info, table)
+        except Exception as e:
+            logger.warning(f"Error reading format cache: {str(e)}")
+        return table
+
+    def _remember_info(self, video_info, info):
+        if video_info['platform'] == 'tiktok':
+            # TikTok downloads need the download profile's extractor_args, which the metadata lookup lacks
+            return
+        key = (video_info['platform'], video_info['id'])
+        with self._info_lock:
+            self._info_cache[key] = (time.time(), info)
+            self._info_cache.move_to_end(key)
+            while len(self._info_cache) > INFO_CACHE_SIZE:
+                self._info_cache.popitem(last=False)
+
+    def _claim_info(self, job):
+        # Move prefetched info onto the queued job so later lookups can't evict it before the job starts
+        key = (job.video_info['platform'], job.video_info['id'])
+        with self._info_lock:
+            if self._claimed_info >= INFO_CLAIM_LIMIT:
+                return
+            entry = self._info_cache.pop(key, None)
+            if entry and time.time() - entry[0] <= INFO_CACHE_TTL:
+                job.prefetched_info = entry
+                self._claimed_info += 1
+
+    def _release_info(self, job):
+        with self._info_lock:
+            entry, job.prefetched_info = job.prefetched_info, None
+            if entry:
+                self._claimed_info -= 1
+        return entry
+
+    def _take_info(self, job):
+        entry = self._release_info(job)
+        if entry is None:
+            key = (job.video_info['platform'], job.video_info['id'])
+            with self._info_lock:
+                entry = self._info_cache.pop(key, None)
+        hit = bool(entry) and time.time() - entry[0] <= INFO_CACHE_TTL
+        self.metrics.cache('info', hit)
+        return entry[1] if hit else None
+
+    def _wait_for_host(self, host, cancel_event=None):
+        while True:
+            wait = self.breaker.wait_time(host)
+            if not wait:
+                return True
+            if cancel_event is None:
+                time.sleep(wait)
+            elif cancel_event.wait(wait):
+                return False
+
+    def _record_failure(self, host, error_class):
+        if self.breaker.record_failure(host, error_class):
+            self.metrics.inc('circuit_open_total', host=host)
+            logger.warning(f"Too many failures from {host}, holding requests for {self.breaker.reset_after:.0f}s")
+
+    def _download_with_retries(self, job):
+        host = error_host(job.url)
+        attempt = 0
+        while self._wait_for_host(host, job._cancel):
+            job.error = None
+            job.error_class = None
+            if self._download(job):
+                self.breaker.record_success(host)
+                return True
+            if job.cancelled:
+                # Frees the trial request slot if this job held it
+                self.breaker.record_failure(host, 'cancelled')
+                return False
+            
+            self._record_failure(host, job.error_class)
+            delay = self.retry_policy.delay(job.error_class, attempt)
+            if delay is None:
+                return False
+            attempt += 1
+            job.retries = attempt
+            self.metrics.inc('retries_total', platform=job.platform, error_class=job.error_class)
+            logger.warning(f"Job {job.id} failed ({job.error_class}), retry {attempt}/"
+                           f"{self.retry_policy.attempts(job.error_class)} in {delay:.1f}s")
+            if job._cancel.wait(delay):
+                return False
+        return False
+
+    def _download_from_info(self, ydl, job, info):
+        try:
+            ydl.process_ie_result(info, download=True)
+            error_code = ydl._download_retcode
+            if not error_code or job.cancelled:
+                return error_code
+            logger.info("Reusing extracted info failed, re-extracting")
         except Exception as e:
-            print(f"Error getting formats: {str(e)}")
-            return ["720p HD", "480p", "360p"], ["High Quality Audio", "Medium Quality Audio"]
+            if "Download cancelled" in str(e) or job.cancelled:
+                raise
+            if classify_error(e) in ('permanent', 'geo'):
+                # Fresh extraction won't change the answer
+                raise
+            logger.info(f"Reusing extracted info failed, re-extracting: {str(e)}")
+        
+        # download() never clears the failed attempt's return code
+        ydl._download_retcode = 0
+        return ydl.download([job.url])
+
+    def _select_formats(self, ydl, info):
+        try:
+            return ydl.process_ie_result(copy.deepcopy(info), download=False)
+        except Exception as e:
+            logger.warning(f"Could not select formats: {str(e)}")
+            return None
+
+    def _plan_postprocessing(self, ydl, job, info):
+        from reidl_postprocess import plan_postprocessing, plan_postprocessors, describe_plan
+        from yt_dlp.utils import prepend_extension, replace_extension
+        
+        selected = self._select_formats(ydl, info)
+        if not selected:
+            return None
+        
+        job.plan = plan_postprocessing(selected, transcode=self.transcode)
+        if job.plan is None:
+            logger.info(f"Job {job.id} postprocessing: not a single video, using the plain download path")
+            return None
+        logger.info(f"Job {job.id} postprocessing: {describe_plan(job.plan)}")
+        
+        for pp in plan_postprocessors(ydl, job.plan):
+            ydl.add_post_processor(pp)
+        
+        if job.plan['action'] == 'remux':
+            # Download under the stream's own extension, the remuxer then writes output_path itself
+            source_path = replace_extension(job.output_path, selected['ext'])
+            ydl.params['outtmpl']['default'] = source_path.replace('%', '%%')
+            job.artifacts.add(source_path)
+            job.artifacts.add(prepend_extension(job.output_path, 'temp'))
+        
+        merge_container = job.plan['merge_container']
+        if merge_container and merge_container != job.plan['container']:
+            ydl.params['merge_output_format'] = merge_container
+            ydl.params['outtmpl']['default'] = replace_extension(job.output_path, merge_container).replace('%', '%%')
+            job.artifacts.add(prepend_extension(job.output_path, 'temp'))
+            selected = self._select_formats(ydl, info)
+        return selected
+
+    def _stream_paths(self, ydl, selected):
+        from yt_dlp.utils import prepend_extension
+        
+        # Use the same component names yt-dlp picks so the merge step finds them already downloaded
+        temp_filename = ydl.prepare_filename(selected, 'temp')
+        stem, ext = os.path.splitext(temp_filename)
+        if ext[1:] != selected['ext']:
+            stem = temp_filename
+        streams = []
+        for f in selected.get('requested_formats') or []:
+            path = prepend_extension(f"{stem}.{f['ext']}", f"f{f['format_id']}", f['ext'])
+            stream_info = dict(selected)
+            del stream_info['requested_formats']
+            stream_info.update(f)
+            streams.append((path, stream_info))
+        return streams
+
+    def _track_streams(self, ydl, job, selected):
+        duration = selected.get('duration')
+        formats = selected.get('requested_formats')
+        if not formats:
+            job.total_bytes = estimate_format_size(selected, duration) or None
+            return
+        
+        # One byte count for the whole job instead of restarting at zero for every stream
+        totals = {path: estimate_format_size(stream_info, duration)
+                  for path, stream_info in self._stream_paths(ydl, selected)}
+        job.total_bytes = sum(totals.values()) if all(totals.values()) else None
+        job.stream_progress = StreamProgress(job.output_path, totals)
+
+    def _download_streams(self, ydl, job, selected):
+        formats = selected.get('requested_formats') or []
+        if (len(formats) < 2 or selected.get('is_live')
+                or any(f.get('protocol') not in PARALLEL_STREAM_PROTOCOLS for f in formats)):
+            return False
+        
+        streams = self._stream_paths(ydl, selected)
+        stream_progress = job.stream_progress
+        results = {}
+        
+        def fetch(path, stream_info):
+            try:
+                results[path] = ydl.dl(path, stream_info)[0]
+            except Exception as e:
+                results[path] = False
+                stream_progress.abort()
+                if not job.cancelled:
+                    logger.warning(f"Stream download failed for {os.path.basename(path)}: {str(e)}")
+        
+        threads = [threading.Thread(target=fetch, args=stream, daemon=True, name=f"reidl-stream-{job.id}-{i}")
+                   for i, stream in enumerate(streams)]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            # Sequential fallback downloads report per stream again from here on
+            stream_progress.reset()
+        
+        if job.cancelled:
+            raise Exception("Download cancelled")
+        return all(results.get(path) for path, _ in streams)
+
+    def queue_download(self, url, video_quality, audio_quality, progress_callback=None, done_callback=None):
+        job = DownloadJob(url, video_quality, audio_quality, progress_callback, done_callback)
+        if not job.video_info:
+            return None
+        self._claim_info(job)
+        return self._submit(job)
 
     def start_download(self, url, video_quality, audio_quality, progress_callback=None):
-        video_info = get_video_id(url)
-        if not video_info:
+        job = self.queue_download(url, video_quality, audio_quality, progress_callback)
+        if not job:
             return False
+        return job.wait()
+
+    def queue_collection(self, url, video_quality, audio_quality, items=None, progress_callback=None,
+                         done_callback=None, job_callback=None):
+        collection = CollectionJob(url, video_quality, audio_quality, items)
+        if not collection.collection_info:
+            return None
+        
+        with self._collections_lock:
+            self._collections.add(collection)
+        thread = threading.Thread(target=self._expand_collection,
+                                  args=(collection, progress_callback, done_callback, job_callback),
+                                  daemon=True, name=f"reidl-expand-{collection.id}")
+        thread.start()
+        return collection
+
+    def _expand_collection(self, collection, progress_callback, done_callback, job_callback):
+        collection.status = 'expanding'
+        seen = set()
+        try:
+            with self.ydl_pool.checkout('playlist', collection.platform) as ydl:
+                info = ydl.extract_info(collection.url, download=False, process=False)
+                if not info:
+                    raise Exception("Could not read playlist")
+                collection.title = info.get('title')
+                
+                for url in self._collection_entries(ydl, info):
+                    if collection.cancelled:
+                        break
+                    
+                    video_info = get_video_id(url)
+                    key = (video_info['platform'], video_info['id'])
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    
+                    collection.discovered += 1
+                    index = collection.discovered
+                    if index > collection.last_item:
+                        break
+                    if not item_selected(index, collection.selection):
+                        continue
+                    
+                    # Stay a bounded distance ahead of the downloads instead of queueing the whole channel
+                    while collection.pending() >= COLLECTION_QUEUE_AHEAD and not collection.cancelled:
+                        collection._cancel.wait(0.5)
+                    if collection.cancelled:
+                        break
+                    
+                    job = DownloadJob(url, collection.video_quality, collection.audio_quality,
+                                      progress_callback, done_callback)
+                    self._submit(job)
+                    collection.jobs.append(job)
+                    if job_callback:
+                        job_callback(job)
             
-        output_filename = self.get_next_available_filename(video_info['platform'])
-        output_path = os.path.join(self.download_path, output_filename)
+            logger.info(f"Collection {collection.id} queued {len(collection.jobs)} of {collection.discovered} entries")
+            collection.finish('cancelled' if collection.cancelled else 'completed')
+        except Exception as e:
+            logger.error(f"Error expanding {collection.url}: {str(e)}")
+            collection.finish('failed', error=str(e))
+        finally:
+            with self._collections_lock:
+                self._collections.discard(collection)
+
+    def _collection_entries(self, ydl, info, depth=0):
+        from yt_dlp.utils import PlaylistEntries
+        
+        if not info:
+            return
+        
+        kind = info.get('_type', 'video')
+        if kind in ('playlist', 'multi_video'):
+            # Lazy entries are only paged in as far as this generator is consumed
+            for _, entry in PlaylistEntries(ydl, info)[:]:
+                yield from self._collection_entries(ydl, entry, depth)
+            return
         
+        url = self._entry_url(info)
+        if not url:
+            return
+        if get_video_id(url):
+            yield url
+        elif kind in ('url', 'url_transparent') and depth < MAX_COLLECTION_DEPTH:
+            # Channel tabs and nested playlists resolve to another page of entries
+            nested = ydl.extract_info(url, download=False, process=False, ie_key=info.get('ie_key'))
+            yield from self._collection_entries(ydl, nested, depth + 1)
+
+    def _entry_url(self, entry):
+        url = entry.get('webpage_url') or entry.get('url')
+        if entry.get('ie_key') == 'Youtube' and entry.get('id') and not get_video_id(url or ''):
+            # Shorts and other YouTube video links without a v= parameter
+            url = f"https://www.youtube.com/watch?v={entry['id']}"
+        return url
+
+    def cancel_collection(self, collection):
+        if not collection:
+            return False
+        collection.cancel()
+        for job in list(collection.jobs):
+            self.cancel_download(job)
+        return True
+
+    def active_jobs(self):
+        return self.queue.jobs() + self.transcodes.jobs()
+
+    def _run_job(self, job):
+        self.metrics.stage(job, 'queued', time.monotonic() - job.created)
+        if job.cancelled:
+            job.finish('cancelled')
+            return
+
+        if self._reuse_download(job):
+            return
+
+        job.status = 'downloading'
+
+        if job.output_path:
+            self.filenames.claim(job.output_path)
+        else:
+            try:
+                job.output_path = self.filenames.reserve(self.download_path, job.platform, job.video_info['id'])
+            except OSError as e:
+                logger.error(f"Could not reserve output file: {str(e)}")
+                job.finish('failed', error=str(e))
+                return
+        self._journal_update(job, status=job.status, output_path=job.output_path)
+
+        success = False
+        try:
+            success = self._download_with_retries(job)
+        finally:
+            if not success:
+                self.filenames.release(job.output_path)
+
+        self.progress.discard(job)
+        self.bandwidth.release(job)
+
+        if job.cancelled:
+            self.cleanup_partial_downloads(job)
+            job.finish('cancelled')
+        elif success and job.plan and job.plan['action'] == 'transcode':
+            # Free this download worker, the transcode waits for a slot in its own pool
+            job.status = 'processing'
+            self._journal_update(job, status=job.status)
+            self.progress.update(job, {'status': 'processing', 'filename': job.output_path})
+            self.transcodes.submit(job)
+        elif success:
+            self._complete(job)
+        else:
+            # The journal entry goes with the failure, nothing would find these partial files again
+            self.cleanup_partial_downloads(job)
+            job.finish('failed', error=job.error)
+
+    def _run_transcode(self, job):
+        from reidl_postprocess import transcode
+        
+        if job.cancelled:
+            self.filenames.release(job.output_path)
+            self.cleanup_partial_downloads(job)
+            job.finish('cancelled')
+            return
+        
+        source = job.output_path
+        merge_container = job.plan['merge_container']
+        if merge_container and merge_container != job.plan['container']:
+            source = os.path.splitext(job.output_path)[0] + '.' + merge_container
+        
+        threads = max(1, self.transcode_threads // self.transcodes.max_workers)
+        try:
+            with self.metrics.timed(job, 'transcode'):
+                finished = transcode(source, job.output_path, threads=threads,
+                                     low_priority=self.transcode_priority == 'low',
+                                     cancelled=lambda: job.cancelled)
+        except Exception as e:
+            job.error_class = classify_error(e)
+            logger.error(f"Transcode error for job {job.id} ({job.error_class}): {str(e)}")
+            self.filenames.release(job.output_path)
+            job.artifacts.add(source)
+            self.cleanup_partial_downloads(job)
+            job.finish('failed', error=str(e))
+            return
+        
+        if not finished or job.cancelled:
+            self.filenames.release(job.output_path)
+            self.cleanup_partial_downloads(job)
+            job.finish('cancelled')
+        else:
+            self._complete(job)
+
+    def _download(self, job):
+        video_info = job.video_info
+        video_quality = job.video_quality
+        audio_quality = job.audio_quality
+        output_path = job.output_path
+
         if video_info['platform'] in ['twitter', 'tiktok']:
             format_str = 'best'
         else:
-            resolution = None
-            if "4K" in video_quality:
-                resolution = 2160
-            elif "2K" in video_quality:
-                resolution = 1440
-            elif "1080p" in video_quality:
-                resolution = 1080
-            elif "720p" in video_quality:
-                resolution = 720
-            elif "480p" in video_quality:
-                resolution = 480
-            else:
-                try:
-                    resolution = int(video_quality.split('p')[0])
-                except:
-                    resolution = 720  
-            
-            audio_bitrate = None
-            if "High Quality" in audio_quality:
-                audio_bitrate = 160
-            elif "Medium Quality" in audio_quality:
-                audio_bitrate = 128
-            else:
-                audio_bitrate = 64
+            resolution = parse_video_quality(video_quality)
+            audio_bitrate = parse_audio_quality(audio_quality)
             
             format_str = (
                 f'bestvideo[height<={resolution}]'
@@ -246,254 +1918,231 @@ class ReiDLCore:
                 f'best[height<={resolution}]/'
                 f'best'
             )
+            
+            table = self._format_table(video_info)
+            exact = table.selector(video_quality, audio_quality) if table else None
+            if exact:
+                # The formats behind the chosen labels, the generic selector only covers IDs that went away
+                format_str = f'{exact}/{format_str}'
         
         def wrapped_progress_hook(d):
-            if 'filename' in d and self.current_download:
-                self.current_download['partial_file'] = d['filename']
-                
-            if self.current_download and self.current_download.get('cancelled', False):
-                print("Download cancelled, raising exception to stop download")
+            job.record_download(d)
+
+            if job.cancelled:
+                logger.debug(f"Job {job.id} cancelled, raising exception to stop download")
                 raise Exception("Download cancelled")
+
+            if job.paused and not job.wait_while_paused():
+                logger.debug(f"Job {job.id} cancelled during pause, raising exception")
+                raise Exception("Download cancelled during pause")
+            
+            if (job.download_started is not None and 'first_byte' not in job.timings
+                    and d.get('downloaded_bytes')):
+                self.metrics.stage(job, 'first_byte', time.monotonic() - job.download_started)
+            
+            self.bandwidth.throttle(job, d)
+            
+            stream_progress = job.stream_progress
+            d = stream_progress.update(d) if stream_progress else d
+            job.total_bytes = d.get('total_bytes') or job.total_bytes
+            self.progress.update(job, d)
+
+        def wrapped_postprocessor_hook(d):
+            job.record_postprocessor(d)
+            self._record_postprocessor_stage(job, d)
+            
+            if job.cancelled:
+                logger.debug(f"Job {job.id} cancelled, stopping postprocessing")
+                raise Exception("Download cancelled")
+        
+        try:
+            info = self._take_info(job)
+            job.reused_info = info is not None
+            job.stream_progress = None
+            job.fragment_workers = self.concurrent_fragments
+            
+            with self.ydl_pool.checkout('download', video_info['platform'],
+                                        format=format_str,
+                                        outtmpl=output_path.replace('%', '%%'),
+                                        progress_hook=wrapped_progress_hook,
+                                        postprocessor_hook=wrapped_postprocessor_hook) as ydl:
+                if info is None:
+                    with self.metrics.timed(job, 'extract'):
+                        info = ydl.extract_info(job.url, download=False, process=False)
+                    if info:
+                        info = ydl.sanitize_info(info, remove_private_keys=True)
                 
-            while self.current_download and self.current_download.get('paused', False):
-                time.sleep(0.1)  
+                selected = self._plan_postprocessing(ydl, job, info) if info else None
+                if selected:
+                    self._track_streams(ydl, job, selected)
+                job.download_started = time.monotonic()
+                if selected and self.parallel_streams and job.stream_progress:
+                    self._download_streams(ydl, job, selected)
                 
-                if self.current_download and self.current_download.get('cancelled', False):
-                    print("Download cancelled during pause, raising exception")
-                    raise Exception("Download cancelled during pause")
-            
-            if progress_callback:
-                progress_callback(d)
+                if info:
+                    error_code = self._download_from_info(ydl, job, info)
+                else:
+                    error_code = ydl.download([job.url])
+            self._finish_download_stage(job)
+            if error_code and not job.cancelled:
+                job.error = "yt-dlp reported a download error"
+                job.error_class = 'unknown'
+            return error_code == 0 and not job.cancelled
+        except Exception as e:
+            self._finish_download_stage(job)
+            if "Download cancelled" in str(e) or job.cancelled:
+                logger.info(f"Download was cancelled: {str(e)}")
+                job.cancel()
+            else:
+                job.error = str(e)
+                job.error_class = classify_error(e)
+                logger.error(f"Download error ({job.error_class}): {str(e)}")
+            return False
+
+    def _finish_download_stage(self, job):
+        if job.download_started is not None:
+            self.metrics.stage(job, 'download', time.monotonic() - job.download_started)
+            job.download_started = None
+
+    def _record_postprocessor_stage(self, job, d):
+        name = d.get('postprocessor')
+        if d.get('status') == 'started':
+            # Merging starts once every stream is on disk, so this is where the download stage ends
+            self._finish_download_stage(job)
+            job.postprocess_started[name] = time.monotonic()
+        elif d.get('status') == 'finished' and name in job.postprocess_started:
+            stage = 'merge' if name == 'Merger' else 'postprocess'
+            self.metrics.stage(job, stage, time.monotonic() - job.postprocess_started.pop(name))
+
+    def _ydl_options(self, profile, platform):
+        extractor_args = {}
+        if platform == 'youtube' and self.split_ranges and self.concurrent_fragments > 1:
+            # Expose YouTube's HTTPS streams as range fragments so they download in parallel too
+            extractor_args['youtube'] = {'formats': ['dashy']}
+        
+        if profile == 'playlist':
+            return {
+                'quiet': True,
+                'no_warnings': True,
+                'extract_flat': 'in_playlist',
+                'lazy_playlist': True,
+                'ignoreerrors': True,
+                'nocheckcertificate': True,
+                'extractor_args': extractor_args,
+            }
+        
+        if profile == 'metadata':
+            return {
+                'quiet': True,
+                'no_warnings': True,
+                'extract_flat': False,
+                'format': 'best',
+                'youtube_include_dash_manifest': True,
+                'nocheckcertificate': True,
+                'extractor_args': extractor_args,
+            }
         
         ydl_opts = {
-            'format': format_str,
-            'outtmpl': output_path,
+            'concurrent_fragment_downloads': self.concurrent_fragments,
+            'overwrites': True,
             'merge_output_format': 'mp4',
-            'postprocessors': [{
-                'key': 'FFmpegVideoConvertor',
-                'preferedformat': 'mp4',
-            }],
+            # Prefer streams that can be stream-copied into mp4 at the same resolution
+            'format_sort': ['res', 'fps', 'vcodec:h264', 'acodec:aac'],
             'prefer_ffmpeg': True,
             'quiet': True,
+            'noprogress': True,
             'no_warnings': True,
             'nocheckcertificate': True,  
-            'ignoreerrors': True,  
             'youtube_include_dash_manifest': True,
         }
 
-        ydl_opts['progress_hooks'] = [wrapped_progress_hook]
+        if platform == 'tiktok':
+            extractor_args['tiktok'] = {
+                'api_hostname': 'api16-normal-c-useast1a.tiktokv.com',
+                'app_version': '25.5.4',
+                'device_id': '7166715775973205509',
+            }
+        ydl_opts['extractor_args'] = extractor_args
+        return ydl_opts
 
-        if video_info['platform'] == 'tiktok':
-            ydl_opts.update({
-                'extractor_args': {
-                    'tiktok': {
-                        'api_hostname': 'api16-normal-c-useast1a.tiktokv.com',
-                        'app_version': '25.5.4',
-                        'device_id': '7166715775973205509',
-                    }
-                }
-            })
-        
-        self.current_download = {
-            'cancelled': False,
-            'paused': False,
-            'output_path': output_path,
-            'partial_file': None
-        }
-        
-        try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                try:
-                    error_code = ydl.download([url])
-                    return error_code == 0 and not self.current_download['cancelled']
-                except Exception as e:
-                    if "Download cancelled" in str(e) or self.current_download['cancelled']:
-                        print(f"Download was cancelled: {str(e)}")
-                        self.current_download['cancelled'] = True
-                        return False
-                    else:
-                        print(f"Download error: {str(e)}")
-                        return False
-        except Exception as e:
-            print(f"YoutubeDL error: {str(e)}")
-            return False
-
-    def toggle_pause(self):
-        if self.current_download:
-            self.current_download['paused'] = not self.current_download['paused']
-            return self.current_download['paused']
+    def toggle_pause(self, job):
+        if job and not job.done and job.status != 'processing':
+            if job.paused:
+                job.resume()
+            else:
+                job.pause()
+            if job.status in ('downloading', 'paused'):
+                job.status = 'paused' if job.paused else 'downloading'
+            return job.paused
         return False
 
-    def cancel_download(self):
-        if self.current_download:
-            print("Setting download as cancelled")
-            self.current_download['cancelled'] = True
-            self.current_download['paused'] = False
+    def cancel_download(self, job):
+        if job and not job.done:
+            logger.info(f"Setting job {job.id} as cancelled")
+            job.cancel()
+
+            if self.queue.remove(job):
+                job.finish('cancelled')
+                return True
             
-            time.sleep(1.0)
+            if self.transcodes.remove(job):
+                self.filenames.release(job.output_path)
+                self.cleanup_partial_downloads(job)
+                job.finish('cancelled')
+                return True
             
-            try:
-                if os.name == 'nt':
-                    import subprocess
-                    print("Attempting to kill ffmpeg processes")
-                    subprocess.run(["taskkill", "/F", "/IM", "ffmpeg.exe"], 
-                                  stderr=subprocess.PIPE, stdout=subprocess.PIPE)
-            except Exception as e:
-                print(f"Error terminating processes: {str(e)}")
-            
-            self.cleanup_partial_downloads()
+            # Only this job stops: transcodes through their worker, inline merges through the postprocessor hook
             return True
         return False
 
-    def cleanup_partial_downloads(self):
-        print("Starting cleanup of partial downloads...")
+    def close(self):
+        self._closing = True
+        with self._collections_lock:
+            expanding = list(self._collections)
+        for collection in expanding:
+            collection.cancel()
+        self.queue.shutdown()
+        self.transcodes.shutdown()
+        self.ydl_pool.close()
+        self.network.close()
+        self.metrics.close()
+        self.config.flush()
+
+    def cancel_all(self):
+        cancelled = 0
+        for job in self.active_jobs():
+            if self.cancel_download(job):
+                cancelled += 1
+        return cancelled
+
+    def cleanup_partial_downloads(self, job):
+        if not job:
+            logger.debug("No download to clean up")
+            return False
         
-        if not self.current_download:
-            print("No current download to clean up")
+        started = time.monotonic()
+        deleted, remaining = remove_files(job.artifact_paths())
+        self.metrics.stage(job, 'cleanup', time.monotonic() - started)
+        if remaining:
+            logger.warning(f"Could not delete {len(remaining)} files for job {job.id}, retrying in background")
+            self._retry_cleanup(job, remaining, 0)
+        
+        logger.info(f"Cleanup for job {job.id} complete. Deleted {deleted} files.")
+        return deleted > 0
+
+    def _retry_cleanup(self, job, paths, attempt):
+        if attempt >= len(CLEANUP_RETRY_DELAYS):
+            for path in paths:
+                logger.error(f"Failed to delete after retries: {path}")
             return
-            
-        patterns_to_clean = []
-        files_deleted = 0
-        files_to_retry = []
         
-        if 'output_path' in self.current_download:
-            try:
-                output_path = self.current_download['output_path']
-                print(f"Checking for output file: {output_path}")
-                
-                if os.path.exists(output_path):
-                    try:
-                        os.remove(output_path)
-                        files_deleted += 1
-                        print(f"Deleted completed file: {output_path}")
-                    except Exception as e:
-                        print(f"Error deleting output file: {str(e)}")
-                        files_to_retry.append(output_path)
-            except Exception as e:
-                print(f"Error checking output file: {str(e)}")
-            
-            try:
-                base_path = os.path.splitext(self.current_download['output_path'])[0]
-                base_dir = os.path.dirname(self.current_download['output_path'])
-                
-                patterns_to_clean.extend([
-                    base_path + "*",                            
-                    os.path.join(base_dir, "*.part"),           
-                    os.path.join(base_dir, "*.temp"),           
-                    os.path.join(base_dir, "*.download"),       
-                    os.path.join(base_dir, "*.ytdl"),           
-                    os.path.join(base_dir, "*.part.*"),         
-                    os.path.join(base_dir, "*_part_*")          
-                ])
-                print(f"Added cleanup patterns based on output path: {base_path}")
-            except Exception as e:
-                print(f"Error setting up output path patterns: {str(e)}")
+        def retry():
+            deleted, remaining = remove_files(paths)
+            if deleted:
+                logger.info(f"Deleted {deleted} files for job {job.id} on retry")
+            if remaining:
+                self._retry_cleanup(job, remaining, attempt + 1)
         
-        if 'partial_file' in self.current_download and self.current_download['partial_file']:
-            try:
-                partial_file = self.current_download['partial_file']
-                print(f"Checking for partial file: {partial_file}")
-                
-                if os.path.exists(partial_file):
-                    try:
-                        os.remove(partial_file)
-                        files_deleted += 1
-                        print(f"Deleted partial file: {partial_file}")
-                    except Exception as e:
-                        print(f"Error deleting partial file: {str(e)}")
-                        files_to_retry.append(partial_file)
-                
-                partial_dir = os.path.dirname(partial_file)
-                partial_base = os.path.splitext(os.path.basename(partial_file))[0]
-                
-                patterns_to_clean.extend([
-                    os.path.join(partial_dir, partial_base + "*"),  
-                    os.path.join(partial_dir, "*.part"),            
-                    os.path.join(partial_dir, "*.temp"),            
-                    os.path.join(partial_dir, "*.download")         
-                ])
-                print(f"Added cleanup patterns based on partial file: {partial_file}")
-            except Exception as e:
-                print(f"Error processing partial file: {str(e)}")
-        
-        try:
-            patterns_to_clean.extend([
-                os.path.join(self.download_path, "*.part"),
-                os.path.join(self.download_path, "*.temp"),
-                os.path.join(self.download_path, "*.download"),
-                os.path.join(self.download_path, "*.ytdl")
-            ])
-            print(f"Added general download folder patterns")
-        except Exception as e:
-            print(f"Error adding general patterns: {str(e)}")
-            
-        for pattern in set(patterns_to_clean):  
-            try:
-                print(f"Searching for files with pattern: {pattern}")
-                matching_files = glob.glob(pattern)
-                print(f"Found {len(matching_files)} matching files")
-                
-                for file in matching_files:
-                    if any(ext in file.lower() for ext in ['.part', '.temp', '.download', '.ytdl', '.webm.', '.m4a.']):
-                        try:
-                            print(f"Attempting to delete: {file}")
-                            os.remove(file)
-                            files_deleted += 1
-                            print(f"Successfully deleted: {file}")
-                        except Exception as e:
-                            print(f"Error deleting file {file}: {str(e)}")
-                            files_to_retry.append(file)
-                    else:
-                        print(f"Skipping non-temporary file: {file}")
-            except Exception as e:
-                print(f"Error processing pattern {pattern}: {str(e)}")
-                
-        if files_to_retry:
-            print(f"Waiting to retry deletion for {len(files_to_retry)} files...")
-            time.sleep(2)
-            
-            retry_deleted = 0
-            for file in files_to_retry:
-                try:
-                    if os.path.exists(file):
-                        print(f"Retrying deletion of: {file}")
-                        os.remove(file)
-                        retry_deleted += 1
-                        files_deleted += 1
-                        print(f"Successfully deleted on retry: {file}")
-                except Exception as e:
-                    print(f"Failed to delete on retry: {file}, Error: {str(e)}")
-                    
-                    try:
-                        if os.name == 'nt' and os.path.exists(file):
-                            print(f"Attempting forced deletion with Windows API: {file}")
-                            import ctypes
-                            if ctypes.windll.kernel32.DeleteFileW(file):
-                                retry_deleted += 1
-                                files_deleted += 1
-                                print(f"Successfully deleted with Windows API: {file}")
-                            else:
-                                print(f"Windows API deletion failed: {file}")
-                    except Exception as e:
-                        print(f"Windows API deletion error: {str(e)}")
-            
-            print(f"Retry cleanup complete. Deleted {retry_deleted} additional files.")
-        
-        if os.name == 'nt' and files_to_retry:
-            remaining_files = [f for f in files_to_retry if os.path.exists(f)]
-            if remaining_files:
-                print(f"Using Windows DEL command for {len(remaining_files)} stubborn files")
-                for file in remaining_files:
-                    try:
-                        file_path = os.path.normpath(file)
-                        import subprocess
-                        subprocess.run(f'DEL /F /Q "{file_path}"', shell=True, 
-                                      stderr=subprocess.PIPE, stdout=subprocess.PIPE)
-                        if not os.path.exists(file):
-                            files_deleted += 1
-                            print(f"Successfully deleted with DEL command: {file}")
-                    except Exception as e:
-                        print(f"DEL command failed for {file}: {str(e)}")
-        
-        print(f"Cleanup complete. Deleted {files_deleted} files.")
-        return files_deleted > 0 
\ No newline at end of file
+        timer = threading.Timer(CLEANUP_RETRY_DELAYS[attempt], retry)
+        timer.daemon = True
+        timer.start()
@@ -0,0 +1,162 @@
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+# Checked in order, the first class with a matching phrase wins
+ERROR_PATTERNS = (
+    ('cancelled', ('download cancelled',)),
+    ('throttled', ('http error 429', 'too many requests', 'rate limit', 'rate-limit',
+                   'not a bot', 'temporarily blocked', 'try again later')),
+    ('geo', ('not available in your country', 'geo restrict', 'geo-restrict',
+             'from your location', 'in your region')),
+    ('permanent', ('video unavailable', 'private video', 'has been removed', 'http error 404',
+                   'http error 410', 'unsupported url', 'no video formats',
+                   'requested format is not available', 'members-only', 'has been terminated',
+                   'copyright', 'confirm your age', 'is not a valid url', 'does not exist',
+                   # Missing postprocessors, retrying won't install them
+                   'ffmpeg not found', 'ffprobe not found', 'ffprobe and ffmpeg not found',
+                   'ffmpeg is not installed', 'ffprobe is not installed')),
+    ('network', ('timed out', 'timeout', 'connection reset', 'connection refused',
+                 'connection aborted', 'temporary failure in name resolution', 'failed to resolve',
+                 'name or service not known', 'network is unreachable', 'incomplete read',
+                 'incompleteread', 'remote end closed', 'http error 5', 'http error 403',
+                 'ssl', 'eof occurred', 'unable to download', 'fragment')),
+)
+
+HTTP_STATUS_CLASSES = {
+    429: 'throttled',
+    403: 'network',
+    404: 'permanent',
+    410: 'permanent',
+}
+
+DEFAULT_RETRY_POLICIES = {
+    'throttled': {'attempts': 4, 'base': 5.0, 'max': 120.0},
+    'network': {'attempts': 3, 'base': 1.0, 'max': 30.0},
+    'unknown': {'attempts': 1, 'base': 2.0, 'max': 10.0},
+    'geo': {'attempts': 0},
+    'permanent': {'attempts': 0},
+    'cancelled': {'attempts': 0},
+}
+
+DEFAULT_BREAKER_THRESHOLD = 5
+DEFAULT_BREAKER_RESET = 60.0
+PROBE_POLL_INTERVAL = 1.0
+
+def _error_chain(error):
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        exc_info = getattr(error, 'exc_info', None)
+        error = (exc_info[1] if exc_info else None) or error.__cause__ or error.__context__
+
+def classify_error(error):
+    if not error:
+        return None
+    if not isinstance(error, BaseException):
+        return _classify_message(str(error))
+
+    messages = []
+    for e in _error_chain(error):
+        if type(e).__name__ == 'GeoRestrictedError':
+            return 'geo'
+        response = getattr(e, 'response', None)
+        status = getattr(e, 'status', None) or getattr(response, 'status', None)
+        if isinstance(status, int):
+            if status in HTTP_STATUS_CLASSES:
+                return HTTP_STATUS_CLASSES[status]
+            if status >= 500:
+                return 'network'
+        messages.append(str(e))
+    return _classify_message(' '.join(messages))
+
+def _classify_message(message):
+    message = message.lower()
+    for error_class, phrases in ERROR_PATTERNS:
+        if any(phrase in message for phrase in phrases):
+            return error_class
+    return 'unknown'
+
+def error_host(url):
+    try:
+        host = (urlparse(url).hostname or '').lower()
+    except ValueError:
+        return None
+    for prefix in ('www.', 'm.', 'mobile.'):
+        if host.startswith(prefix):
+            return host[len(prefix):]
+    return host or None
+
+class RetryPolicy:
+    def __init__(self, policies=None):
+        self.policies = {error_class: dict(policy) for error_class, policy in DEFAULT_RETRY_POLICIES.items()}
+        for error_class, policy in (policies or {}).items():
+            self.policies.setdefault(error_class, {}).update(policy)
+
+    def attempts(self, error_class):
+        return self.policies.get(error_class, {}).get('attempts', 0)
+
+    def delay(self, error_class, attempt):
+        policy = self.policies.get(error_class) or {}
+        if attempt >= policy.get('attempts', 0):
+            return None
+
+        # Exponential backoff with equal jitter: at least half the step, never in lockstep with other jobs
+        step = min(policy.get('max', 60.0), policy.get('base', 1.0) * 2 ** attempt)
+        return step / 2 + random.uniform(0, step / 2)
+
+class CircuitBreaker:
+    def __init__(self, threshold=DEFAULT_BREAKER_THRESHOLD, reset_after=DEFAULT_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def wait_time(self, host):
+        with self._lock:
+            state = self._hosts.get(host)
+            if not state:
+                return 0
+            now = time.monotonic()
+            if state['opened'] is not None:
+                remaining = state['opened'] + self.reset_after - now
+                if remaining > 0:
+                    return remaining
+                # Half-open: the next failure opens it again straight away
+                state['opened'] = None
+                state['half_open'] = True
+            if not state['half_open']:
+                return 0
+            if state['probing'] is not None and now - state['probing'] < self.reset_after:
+                # One trial request at a time, everyone else waits for its result
+                return PROBE_POLL_INTERVAL
+            state['probing'] = now
+            return 0
+
+    def record_success(self, host):
+        with self._lock:
+            self._hosts.pop(host, None)
+
+    def record_failure(self, host, error_class):
+        with self._lock:
+            if error_class not in ('throttled', 'network'):
+                # Says nothing about the host's health, the next request probes instead
+                if host in self._hosts:
+                    self._hosts[host]['probing'] = None
+                return False
+            state = self._hosts.setdefault(host, {'failures': 0, 'opened': None,
+                                                  'half_open': False, 'probing': None})
+            state['probing'] = None
+            state['failures'] += 1
+            if state['half_open'] or state['failures'] >= self.threshold:
+                state['opened'] = time.monotonic()
+                state['failures'] = 0
+                state['half_open'] = False
+                return True
+        return False
+
+    def open_hosts(self):
+        with self._lock:
+            return [host for host, state in self._hosts.items() if state['opened'] is not None]
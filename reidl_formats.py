@@ -0,0 +1,225 @@
+from array import array
+
+CODEC_FAMILIES = {
+    'avc1': 'h264',
+    'avc3': 'h264',
+    'h264': 'h264',
+    'hev1': 'h265',
+    'hvc1': 'h265',
+    'h265': 'h265',
+    'hevc': 'h265',
+    'vp09': 'vp9',
+    'vp9': 'vp9',
+    'av01': 'av1',
+    'av1': 'av1',
+    'vp8': 'vp8',
+    'mp4a': 'aac',
+    'aac': 'aac',
+    'opus': 'opus',
+    'mp3': 'mp3',
+    'vorbis': 'vorbis',
+    'flac': 'flac',
+    'ac-3': 'ac3',
+    'ac3': 'ac3',
+    'ec-3': 'eac3',
+    'eac3': 'eac3',
+}
+
+VIDEO_QUALITY_LABELS = (
+    (2160, "4K"),
+    (1440, "2K"),
+    (1080, "1080p HD"),
+    (720, "720p HD"),
+    (480, "480p"),
+)
+
+def codec_family(codec):
+    if not codec or codec == 'none':
+        return None
+    codec = codec.lower()
+    return CODEC_FAMILIES.get(codec.split('.')[0], codec)
+
+def video_quality_label(height):
+    for minimum, label in VIDEO_QUALITY_LABELS:
+        if height >= minimum:
+            return label
+    return f"{height}p"
+
+def audio_quality_label(abr):
+    if abr >= 160:
+        return "High Quality Audio"
+    elif abr >= 128:
+        return "Medium Quality Audio"
+    return "Low Quality Audio"
+
+def size_suffix(size):
+    if not size:
+        return ''
+    size_mb = size / (1024 * 1024)
+    if size_mb >= 1024:
+        return f" (~{size_mb/1024:.1f}GB)"
+    return f" (~{size_mb:.0f}MB)"
+
+def estimate_format_size(f, duration=None):
+    size = f.get('filesize') or f.get('filesize_approx')
+    if size:
+        return size
+    # tbr is in kbit/s
+    tbr = f.get('tbr') or (f.get('vbr') or 0) + (f.get('abr') or 0)
+    duration = duration or f.get('duration')
+    if tbr and duration:
+        return int(tbr * duration * 125)
+    return 0
+
+def base_label(label):
+    return label.split(' (~')[0]
+
+class FormatTable:
+    NUMERIC_COLUMNS = {
+        'height': 'l',
+        'fps': 'd',
+        'tbr': 'd',
+        'vbr': 'd',
+        'abr': 'd',
+        'size': 'd',
+    }
+    TEXT_COLUMNS = ('format_id', 'vcodec', 'acodec', 'ext', 'protocol')
+
+    def __init__(self, columns=None):
+        for name, typecode in self.NUMERIC_COLUMNS.items():
+            setattr(self, name, array(typecode))
+        for name in self.TEXT_COLUMNS:
+            setattr(self, name, [])
+
+        self.duration = 0
+        if columns:
+            rows = len(columns['format_id'])
+            for name in tuple(self.NUMERIC_COLUMNS) + self.TEXT_COLUMNS:
+                # Tables cached before a column was added get it filled with zeros or empty strings
+                fill = '' if name in self.TEXT_COLUMNS else 0
+                getattr(self, name).extend(columns.get(name) or [fill] * rows)
+            self.duration = columns.get('duration') or 0
+        self._ladders = None
+
+    @classmethod
+    def from_formats(cls, formats, duration=None):
+        table = cls()
+        table.duration = duration or 0
+        for f in formats:
+            format_id = f.get('format_id')
+            if not format_id:
+                continue
+            table.format_id.append(format_id)
+            table.height.append(int(f.get('height') or 0))
+            table.fps.append(float(f.get('fps') or 0))
+            table.tbr.append(float(f.get('tbr') or 0))
+            table.vbr.append(float(f.get('vbr') or 0))
+            table.abr.append(float(f.get('abr') or 0))
+            table.size.append(float(f.get('filesize') or f.get('filesize_approx') or 0))
+            table.vcodec.append(codec_family(f.get('vcodec')) or '')
+            table.acodec.append(codec_family(f.get('acodec')) or '')
+            table.ext.append(f.get('ext') or '')
+            table.protocol.append(f.get('protocol') or '')
+        return table
+
+    def to_dict(self):
+        data = {name: list(getattr(self, name))
+                for name in tuple(self.NUMERIC_COLUMNS) + self.TEXT_COLUMNS}
+        data['duration'] = self.duration
+        return data
+
+    def __len__(self):
+        return len(self.format_id)
+
+    def has_video(self, i):
+        return bool(self.vcodec[i]) and self.height[i] > 0
+
+    def is_audio_only(self, i):
+        return bool(self.acodec[i]) and not self.vcodec[i]
+
+    def select(self, predicate=None, key=None, reverse=True):
+        indices = [i for i in range(len(self)) if predicate is None or predicate(i)]
+        if key:
+            indices.sort(key=key, reverse=reverse)
+        return indices
+
+    def video_key(self, i):
+        # Same preference order as the download profile's format_sort, video-only streams before muxed ones
+        return (self.height[i], self.fps[i], self.vcodec[i] == 'h264',
+                not self.acodec[i], self.tbr[i])
+
+    def audio_key(self, i):
+        return (self.acodec[i] == 'aac', self.abr[i])
+
+    def ladders(self):
+        if self._ladders is None:
+            self._ladders = (self._video_ladder(), self._audio_ladder())
+        return self._ladders
+
+    def _video_ladder(self):
+        ladder = {}
+        for i in self.select(self.has_video, key=self.video_key):
+            ladder.setdefault(video_quality_label(self.height[i]), i)
+        return ladder
+
+    def _audio_ladder(self):
+        indices = (self.select(lambda i: self.is_audio_only(i) and self.abr[i] > 0)
+                   or self.select(lambda i: bool(self.acodec[i]) and self.abr[i] > 0))
+
+        ladder = {}
+        for i in sorted(indices, key=lambda i: self.abr[i], reverse=True):
+            label = audio_quality_label(self.abr[i])
+            if label not in ladder or self.audio_key(i) > self.audio_key(ladder[label]):
+                ladder[label] = i
+        return ladder
+
+    def estimate_size(self, i):
+        return int(estimate_format_size({'filesize': self.size[i], 'tbr': self.tbr[i],
+                                         'vbr': self.vbr[i], 'abr': self.abr[i]}, self.duration))
+
+    def pair(self, video_quality, audio_quality):
+        video_ladder, audio_ladder = self.ladders()
+        video = video_ladder.get(base_label(video_quality))
+        if video is None:
+            return None, None
+
+        audio = audio_ladder.get(audio_quality)
+        if self.acodec[video] or audio is None or not self.is_audio_only(audio):
+            return video, None
+        return video, audio
+
+    def pair_size(self, video, audio):
+        sizes = [self.estimate_size(i) for i in (video, audio) if i is not None]
+        # A missing estimate for either stream would understate the merged file
+        return sum(sizes) if sizes and all(sizes) else 0
+
+    def estimate(self, video_quality, audio_quality):
+        video, audio = self.pair(video_quality, audio_quality)
+        if video is None:
+            return None
+        return self.pair_size(video, audio) or None
+
+    def size_estimates(self):
+        video_ladder, audio_ladder = self.ladders()
+        return {(video_label, audio_label): self.estimate(video_label, audio_label)
+                for video_label in video_ladder for audio_label in audio_ladder}
+
+    def video_labels(self):
+        video_ladder, audio_ladder = self.ladders()
+        best_audio = next(iter(audio_ladder), None)
+        labels = []
+        for label in video_ladder:
+            video, audio = self.pair(label, best_audio)
+            labels.append(label + size_suffix(self.pair_size(video, audio)))
+        return labels
+
+    def audio_labels(self):
+        return list(self.ladders()[1])
+
+    def selector(self, video_quality, audio_quality):
+        video, audio = self.pair(video_quality, audio_quality)
+        if video is None:
+            return None
+        if audio is None:
+            return self.format_id[video]
+        return f"{self.format_id[video]}+{self.format_id[audio]}"
@@ -0,0 +1,216 @@
+import collections
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger('reidl.metrics')
+
+DEFAULT_PROMETHEUS_PORT = 9464
+METRIC_PREFIX = 'reidl_'
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+def _format_labels(key):
+    if not key:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in key) + '}'
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = collections.defaultdict(float)
+        self._summaries = {}
+        self._sinks = []
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            self._counters[(name, _label_key(labels))] += value
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                self._summaries[key] = [1, value, value, value]
+            else:
+                summary[0] += 1
+                summary[1] += value
+                summary[2] = min(summary[2], value)
+                summary[3] = max(summary[3], value)
+
+    def stage(self, job, stage, seconds):
+        job.timings[stage] = job.timings.get(stage, 0) + seconds
+        self.observe('stage_seconds', seconds, stage=stage, platform=job.platform)
+
+    @contextlib.contextmanager
+    def timed(self, job, stage):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.stage(job, stage, time.monotonic() - started)
+
+    def cache(self, cache, hit):
+        self.inc('cache_requests_total', cache=cache, result='hit' if hit else 'miss')
+
+    def hit_rate(self, cache):
+        with self._lock:
+            hits = self._counters.get(('cache_requests_total', _label_key({'cache': cache, 'result': 'hit'})), 0)
+            misses = self._counters.get(('cache_requests_total', _label_key({'cache': cache, 'result': 'miss'})), 0)
+        return hits / (hits + misses) if hits + misses else None
+
+    def job_finished(self, job):
+        download_time = job.timings.get('download')
+        downloaded = job.total_bytes if job.success and not job.duplicate_of else None
+        throughput = downloaded / download_time if downloaded and download_time else None
+
+        self.inc('jobs_total', platform=job.platform, status=job.status, error_class=job.error_class)
+        if downloaded:
+            self.inc('downloaded_bytes_total', downloaded, platform=job.platform)
+        if throughput:
+            self.observe('throughput_bytes_per_second', throughput, platform=job.platform)
+
+        self.emit({
+            'event': 'job',
+            'time': round(time.time(), 3),
+            'job': job.id,
+            'url': job.url,
+            'platform': job.platform,
+            'status': job.status,
+            'error_class': job.error_class,
+            'retries': job.retries,
+            'resumed_bytes': job.resumed_bytes or None,
+            'reused_info': job.reused_info,
+            'bytes': downloaded,
+            'throughput': round(throughput) if throughput else None,
+            'timings': {stage: round(seconds, 3) for stage, seconds in job.timings.items()},
+        })
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            summaries = {key: list(value) for key, value in self._summaries.items()}
+        return counters, summaries
+
+    def render_prometheus(self):
+        counters, summaries = self.snapshot()
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} counter")
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{METRIC_PREFIX}{name}{_format_labels(labels)} {value:g}")
+        for name in sorted({name for name, _ in summaries}):
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} summary")
+            for (metric, labels), (count, total, _, maximum) in sorted(summaries.items()):
+                if metric == name:
+                    lines.append(f"{METRIC_PREFIX}{name}_count{_format_labels(labels)} {count}")
+                    lines.append(f"{METRIC_PREFIX}{name}_sum{_format_labels(labels)} {total:g}")
+                    lines.append(f"{METRIC_PREFIX}{name}_max{_format_labels(labels)} {maximum:g}")
+        return '\n'.join(lines) + '\n'
+
+    def add_sink(self, sink):
+        with self._lock:
+            self._sinks.append(sink)
+        return sink
+
+    def remove_sink(self, sink):
+        with self._lock:
+            if sink in self._sinks:
+                self._sinks.remove(sink)
+
+    def emit(self, record):
+        with self._lock:
+            sinks = list(self._sinks)
+        for sink in sinks:
+            try:
+                sink.emit(record)
+            except Exception as e:
+                logger.warning(f"Metrics sink {type(sink).__name__} failed: {str(e)}")
+
+    def close(self):
+        with self._lock:
+            sinks = list(self._sinks)
+            self._sinks.clear()
+        for sink in sinks:
+            try:
+                sink.close()
+            except Exception as e:
+                logger.warning(f"Error closing metrics sink: {str(e)}")
+
+class LogSink:
+    def __init__(self, name='reidl.metrics', level=logging.INFO):
+        self.logger = logging.getLogger(name)
+        self.level = level
+
+    def emit(self, record):
+        self.logger.log(self.level, json.dumps(record, sort_keys=True))
+
+    def close(self):
+        pass
+
+class JsonFileSink:
+    def __init__(self, path):
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self._lock = threading.Lock()
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def emit(self, record):
+        line = json.dumps(record)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+class PrometheusSink:
+    def __init__(self, metrics, port=DEFAULT_PROMETHEUS_PORT, host='127.0.0.1'):
+        self.metrics = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path.split('?')[0] not in ('/', '/metrics'):
+                    handler.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode('utf-8')
+                handler.send_response(200)
+                handler.send_header('Content-Type', 'text/plain; version=0.0.4')
+                handler.send_header('Content-Length', str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, format, *args):
+                logger.debug(format % args)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True, name="reidl-metrics")
+        self.thread.start()
+        logger.info(f"Serving metrics on http://{host}:{self.server.server_port}/metrics")
+
+    def emit(self, record):
+        pass
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def create_sink(spec, metrics):
+    if isinstance(spec, str):
+        spec = {'type': spec}
+    kind = spec.get('type')
+    if kind == 'log':
+        return LogSink()
+    elif kind == 'json':
+        return JsonFileSink(spec['path'])
+    elif kind == 'prometheus':
+        return PrometheusSink(metrics, port=spec.get('port', DEFAULT_PROMETHEUS_PORT),
+                              host=spec.get('host', '127.0.0.1'))
+    raise ValueError(f"Unknown metrics sink: {kind}")
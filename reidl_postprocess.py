@@ -0,0 +1,130 @@
+import os
+import shutil
+import subprocess
+from yt_dlp.postprocessor import FFmpegPostProcessor, FFmpegVideoRemuxerPP
+from yt_dlp.utils import prepend_extension
+from reidl_formats import codec_family
+
+LOW_PRIORITY_NICENESS = 10
+
+MP4_VIDEO_CODECS = ('h264', 'h265', 'vp9', 'av1')
+MP4_AUDIO_CODECS = ('aac', 'mp3', 'opus', 'flac', 'ac3', 'eac3')
+
+def stream_codecs(info):
+    video_codec = audio_codec = None
+    for f in info.get('requested_formats') or [info]:
+        video_codec = video_codec or codec_family(f.get('vcodec'))
+        audio_codec = audio_codec or codec_family(f.get('acodec'))
+    return video_codec, audio_codec
+
+def plan_postprocessing(info, container='mp4', transcode=False):
+    if info.get('_type', 'video') != 'video' or not (info.get('requested_formats') or info.get('ext')):
+        # Playlists (e.g. multi-video tweets) keep yt-dlp's own per-entry handling
+        return None
+
+    formats = info.get('requested_formats') or [info]
+    video_codec, audio_codec = stream_codecs(info)
+    source = 'merge' if len(formats) > 1 else formats[0].get('ext')
+
+    plan = {
+        'action': 'none',
+        'source': source,
+        'container': container,
+        'merge_container': container if len(formats) > 1 else None,
+        'video_codec': video_codec,
+        'audio_codec': audio_codec,
+        'reason': None,
+    }
+
+    compatible = (video_codec in MP4_VIDEO_CODECS + (None,)
+                  and audio_codec in MP4_AUDIO_CODECS + (None,))
+
+    if transcode and (video_codec, audio_codec) != ('h264', 'aac'):
+        plan['action'] = 'transcode'
+        plan['reason'] = "re-encode to H.264/AAC requested"
+    elif not compatible:
+        plan['action'] = 'transcode'
+        plan['reason'] = f"{video_codec}/{audio_codec} cannot be stored in {container}"
+    elif len(formats) > 1:
+        plan['action'] = 'merge'
+        plan['reason'] = "stream copy into one file"
+    elif source != container:
+        plan['action'] = 'remux'
+        plan['reason'] = f"stream copy from {source} to {container}"
+
+    if plan['action'] == 'transcode' and plan['merge_container']:
+        # Merge into a container that accepts any codec, the transcode writes the final file
+        plan['merge_container'] = 'mkv'
+    return plan
+
+def describe_plan(plan):
+    codecs = '/'.join(codec or '?' for codec in (plan['video_codec'], plan['audio_codec']))
+    text = f"{plan['action']} ({codecs} -> {plan['container']})"
+    if plan['reason']:
+        text += f": {plan['reason']}"
+    return text
+
+def plan_postprocessors(ydl, plan):
+    if plan['action'] == 'remux':
+        return [FFmpegVideoRemuxerPP(ydl, preferedformat=plan['container'])]
+    # Transcodes run later on the core's transcode queue, off the download thread
+    return []
+
+def ffmpeg_executable():
+    return FFmpegPostProcessor().executable
+
+def _priority_command(low_priority):
+    if low_priority and os.name != 'nt' and shutil.which('nice'):
+        return ['nice', '-n', str(LOW_PRIORITY_NICENESS)]
+    return []
+
+def _priority_options(low_priority):
+    if low_priority and os.name == 'nt':
+        return {'creationflags': subprocess.BELOW_NORMAL_PRIORITY_CLASS}
+    return {}
+
+def transcode(source, target, threads=0, low_priority=True, cancelled=None,
+              video_codec='libx264', audio_codec='aac'):
+    executable = ffmpeg_executable()
+    if not executable:
+        raise RuntimeError("ffmpeg not found")
+
+    temp_path = prepend_extension(target, 'temp')
+    cmd = _priority_command(low_priority) + [
+        executable, '-y', '-nostdin', '-hide_banner', '-loglevel', 'error',
+        '-i', source,
+        '-map', '0:v?', '-map', '0:a?',
+        '-c:v', video_codec, '-c:a', audio_codec,
+        '-threads', str(threads),
+        '-movflags', '+faststart',
+        temp_path,
+    ]
+
+    proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, text=True, **_priority_options(low_priority))
+    while True:
+        try:
+            _, stderr = proc.communicate(timeout=0.2)
+            break
+        except subprocess.TimeoutExpired:
+            if cancelled and cancelled():
+                proc.kill()
+                proc.communicate()
+                _remove(temp_path)
+                return False
+
+    if proc.returncode:
+        _remove(temp_path)
+        lines = (stderr or '').strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else f"ffmpeg exited with code {proc.returncode}")
+
+    os.replace(temp_path, target)
+    if source != target:
+        _remove(source)
+    return True
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
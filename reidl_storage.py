@@ -0,0 +1,304 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+APP_NAME = 'reiDL'
+
+DEFAULT_CACHE_TTL = 6 * 60 * 60
+DEFAULT_CACHE_ENTRIES = 1000
+
+PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+STILL_ACTIVE = 259
+
+def _app_dir(windows_env, mac_folder, xdg_env, xdg_default):
+    if os.name == 'nt':
+        base = os.environ.get(windows_env) or os.path.expanduser("~")
+        path = os.path.join(base, APP_NAME)
+    elif sys.platform == 'darwin':
+        path = os.path.join(os.path.expanduser("~/Library"), mac_folder, APP_NAME)
+    else:
+        base = os.environ.get(xdg_env) or os.path.expanduser(xdg_default)
+        path = os.path.join(base, APP_NAME.lower())
+
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def user_data_dir():
+    return _app_dir('LOCALAPPDATA', 'Application Support', 'XDG_DATA_HOME', "~/.local/share")
+
+def user_cache_dir():
+    return _app_dir('LOCALAPPDATA', 'Caches', 'XDG_CACHE_HOME', "~/.cache")
+
+def user_config_dir():
+    return _app_dir('APPDATA', 'Application Support', 'XDG_CONFIG_HOME', "~/.config")
+
+def process_alive(pid):
+    if not pid or pid <= 0:
+        return False
+    if pid == os.getpid():
+        return True
+    if os.name == 'nt':
+        import ctypes
+        # os.kill would terminate the process on Windows, ask for its exit code instead
+        handle = ctypes.windll.kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            return False
+        try:
+            code = ctypes.c_ulong()
+            ctypes.windll.kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+            return code.value == STILL_ACTIVE
+        finally:
+            ctypes.windll.kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+class FormatCache:
+    def __init__(self, path=None, ttl=DEFAULT_CACHE_TTL, max_entries=DEFAULT_CACHE_ENTRIES):
+        self.path = path or os.path.join(user_cache_dir(), 'formats.db')
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS formats ("
+            " platform TEXT NOT NULL,"
+            " video_id TEXT NOT NULL,"
+            " data TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " accessed REAL NOT NULL,"
+            " PRIMARY KEY (platform, video_id))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS formats_accessed ON formats (accessed)")
+        self._conn.commit()
+        self.prune()
+
+    def get(self, platform, video_id):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, created FROM formats WHERE platform = ? AND video_id = ?",
+                (platform, video_id)
+            ).fetchone()
+
+            if not row:
+                return None
+
+            data, created = row
+            if now - created > self.ttl:
+                self._conn.execute(
+                    "DELETE FROM formats WHERE platform = ? AND video_id = ?",
+                    (platform, video_id)
+                )
+                self._conn.commit()
+                return None
+
+            self._conn.execute(
+                "UPDATE formats SET accessed = ? WHERE platform = ? AND video_id = ?",
+                (now, platform, video_id)
+            )
+            self._conn.commit()
+
+        try:
+            return json.loads(data)
+        except json.JSONDecodeError:
+            self.delete(platform, video_id)
+            return None
+
+    def put(self, platform, video_id, data):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO formats (platform, video_id, data, created, accessed)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (platform, video_id, json.dumps(data), now, now)
+            )
+            self._prune_locked(now)
+            self._conn.commit()
+
+    def delete(self, platform, video_id):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM formats WHERE platform = ? AND video_id = ?",
+                (platform, video_id)
+            )
+            self._conn.commit()
+
+    def prune(self):
+        with self._lock:
+            self._prune_locked(time.time())
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM formats")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _prune_locked(self, now):
+        self._conn.execute("DELETE FROM formats WHERE created < ?", (now - self.ttl,))
+        self._conn.execute(
+            "DELETE FROM formats WHERE rowid IN ("
+            " SELECT rowid FROM formats ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+class JobJournal:
+    COLUMNS = ('url', 'platform', 'video_id', 'video_quality', 'audio_quality',
+               'output_path', 'downloaded_bytes', 'total_bytes', 'status')
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(user_data_dir(), 'jobs.db')
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " url TEXT NOT NULL,"
+            " platform TEXT,"
+            " video_id TEXT,"
+            " video_quality TEXT,"
+            " audio_quality TEXT,"
+            " output_path TEXT,"
+            " downloaded_bytes INTEGER NOT NULL DEFAULT 0,"
+            " total_bytes INTEGER,"
+            " status TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " updated REAL NOT NULL,"
+            " owner INTEGER)"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")]
+        if 'owner' not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN owner INTEGER")
+        self._conn.commit()
+
+    def add(self, url, platform, video_id, video_quality, audio_quality, status='queued'):
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (url, platform, video_id, video_quality, audio_quality,"
+                " status, created, updated, owner) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, platform, video_id, video_quality, audio_quality, status, now, now, os.getpid())
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def update(self, entry_id, **fields):
+        unknown = set(fields) - set(self.COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown journal fields: {', '.join(sorted(unknown))}")
+
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET {assignments}, updated = ? WHERE id = ?",
+                (*fields.values(), time.time(), entry_id)
+            )
+            self._conn.commit()
+
+    def claim(self, entry_id, previous_owner):
+        # Compare-and-set, so of two processes resuming the same entry only one wins
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET owner = ?, updated = ? WHERE id = ? AND owner IS ?",
+                (os.getpid(), time.time(), entry_id, previous_owner)
+            )
+            self._conn.commit()
+            return cursor.rowcount == 1
+
+    def remove(self, entry_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (entry_id,))
+            self._conn.commit()
+
+    def entries(self):
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, {', '.join(self.COLUMNS)}, owner FROM jobs ORDER BY id"
+            ).fetchall()
+        return [dict(zip(('id',) + self.COLUMNS + ('owner',), row)) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class DownloadArchive:
+    def __init__(self, path=None):
+        self.path = path or os.path.join(user_data_dir(), 'archive.db')
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS downloads ("
+            " platform TEXT NOT NULL,"
+            " video_id TEXT NOT NULL,"
+            " quality TEXT NOT NULL,"
+            " path TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created REAL NOT NULL,"
+            " PRIMARY KEY (platform, video_id, quality))"
+        )
+        self._conn.commit()
+
+    def find(self, platform, video_id, quality):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT path, size FROM downloads WHERE platform = ? AND video_id = ? AND quality = ?",
+                (platform, video_id, quality)
+            ).fetchone()
+
+        if not row:
+            return None
+
+        path, size = row
+        try:
+            if os.path.getsize(path) == size:
+                return path
+        except OSError:
+            pass
+
+        # The file was moved, deleted or replaced since it was recorded
+        self.remove(platform, video_id, quality)
+        return None
+
+    def add(self, platform, video_id, quality, path):
+        size = os.path.getsize(path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO downloads (platform, video_id, quality, path, size, created)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (platform, video_id, quality, path, size, time.time())
+            )
+            self._conn.commit()
+
+    def remove(self, platform, video_id, quality):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM downloads WHERE platform = ? AND video_id = ? AND quality = ?",
+                (platform, video_id, quality)
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,24 +1,62 @@
+import logging
+import os
+import sys
+import time
+
+STARTUP_TIMING = '--startup-timing' in sys.argv or os.environ.get('REIDL_STARTUP_TIMING') == '1'
+_startup_started = time.perf_counter()
+_startup_last = _startup_started
+_startup_phases = []
+
+def mark_startup(phase):
+    global _startup_last
+    now = time.perf_counter()
+    _startup_phases.append((phase, now - _startup_last, now - _startup_started))
+    _startup_last = now
+
+def report_startup():
+    if not STARTUP_TIMING:
+        return
+    print("Startup timings:")
+    for phase, duration, total in _startup_phases:
+        print(f"  {phase:<28} {duration * 1000:8.1f} ms  (at {total * 1000:8.1f} ms)")
+
 import customtkinter as ctk
 import tkinter as tk
 from tkinter import filedialog
-import json
-import os
+mark_startup("import customtkinter")
 import threading
+import ctypes
 from PIL import Image
+mark_startup("import PIL")
 import keyboard
-import pystray
-import time
-import ctypes
-from reidl_core import ReiDLCore, get_video_id
-import win32gui
-import win32con
+mark_startup("import keyboard")
+from reidl_core import (ReiDLCore, COLLECTION_VIDEO_QUALITIES, COLLECTION_AUDIO_QUALITIES,
+                        get_video_id, get_collection_id)
+mark_startup("import reidl_core")
+
+DUPLICATE_LABELS = {
+    'reuse': "Use the existing file",
+    'link': "Link it into this folder",
+    'download': "Download it again",
+}
+
+BANDWIDTH_LABELS = {
+    None: "Unlimited",
+    1024 * 1024: "1 MB/s",
+    2 * 1024 * 1024: "2 MB/s",
+    5 * 1024 * 1024: "5 MB/s",
+    10 * 1024 * 1024: "10 MB/s",
+    20 * 1024 * 1024: "20 MB/s",
+    50 * 1024 * 1024: "50 MB/s",
+}
 
 class SettingsWindow(ctk.CTkToplevel):
     def __init__(self, parent, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.parent = parent
         self.title("Settings")
-        self.geometry("300x250")  
+        self.geometry("300x590")  
         
         self.update_idletasks()
         width = self.winfo_width()
@@ -56,6 +94,59 @@ class SettingsWindow(ctk.CTkToplevel):
                                       command=self.start_hotkey_listen)
         self.hotkey_btn.pack(pady=5)
         
+        self.connections_frame = ctk.CTkFrame(self)
+        self.connections_frame.pack(fill="x", padx=20, pady=(0, 10))
+        
+        self.connections_label = ctk.CTkLabel(self.connections_frame, text="Parallel connections per download")
+        self.connections_label.pack(pady=5)
+        
+        self.connections_var = ctk.StringVar(value=str(self.parent.core.concurrent_fragments))
+        self.connections_menu = ctk.CTkOptionMenu(self.connections_frame,
+                                                values=["1", "2", "4", "8", "16"],
+                                                variable=self.connections_var)
+        self.connections_menu.pack(pady=5)
+        
+        self.split_ranges_var = ctk.BooleanVar(value=self.parent.core.split_ranges)
+        self.split_ranges_check = ctk.CTkCheckBox(self.connections_frame,
+                                                text="Split large YouTube files",
+                                                variable=self.split_ranges_var)
+        self.split_ranges_check.pack(pady=5)
+        
+        self.parallel_streams_var = ctk.BooleanVar(value=self.parent.core.parallel_streams)
+        self.parallel_streams_check = ctk.CTkCheckBox(self.connections_frame,
+                                                    text="Fetch video and audio together",
+                                                    variable=self.parallel_streams_var)
+        self.parallel_streams_check.pack(pady=5)
+        
+        self.transcode_var = ctk.BooleanVar(value=self.parent.core.transcode)
+        self.transcode_check = ctk.CTkCheckBox(self.connections_frame,
+                                             text="Re-encode to H.264/AAC",
+                                             variable=self.transcode_var)
+        self.transcode_check.pack(pady=5)
+        
+        self.duplicate_label = ctk.CTkLabel(self.connections_frame, text="If already downloaded")
+        self.duplicate_label.pack(pady=(5, 0))
+        
+        self.duplicate_var = ctk.StringVar(value=DUPLICATE_LABELS[self.parent.core.duplicate_mode])
+        self.duplicate_menu = ctk.CTkOptionMenu(self.connections_frame,
+                                              values=list(DUPLICATE_LABELS.values()),
+                                              variable=self.duplicate_var)
+        self.duplicate_menu.pack(pady=5)
+        
+        self.bandwidth_label = ctk.CTkLabel(self.connections_frame, text="Total download speed limit")
+        self.bandwidth_label.pack(pady=(5, 0))
+        
+        limit = self.parent.core.bandwidth.limit
+        if limit in BANDWIDTH_LABELS:
+            label = BANDWIDTH_LABELS[limit]
+        else:
+            label = f"{limit / 1024 / 1024:g} MB/s"
+        self.bandwidth_var = ctk.StringVar(value=label)
+        self.bandwidth_menu = ctk.CTkOptionMenu(self.connections_frame,
+                                              values=list(BANDWIDTH_LABELS.values()),
+                                              variable=self.bandwidth_var)
+        self.bandwidth_menu.pack(pady=5)
+        
         self.save_btn = ctk.CTkButton(self,
                                     text="Save Settings",
                                     command=self.save_settings)
@@ -186,6 +277,23 @@ class SettingsWindow(ctk.CTkToplevel):
         if self.new_hotkey is not None:
             if isinstance(self.new_hotkey, dict) and 'name' in self.new_hotkey:
                 self.parent.set_hotkey(self.new_hotkey)
+        
+        concurrent_fragments = int(self.connections_var.get())
+        split_ranges = self.split_ranges_var.get()
+        parallel_streams = self.parallel_streams_var.get()
+        core = self.parent.core
+        if (concurrent_fragments != core.concurrent_fragments or split_ranges != core.split_ranges
+                or parallel_streams != core.parallel_streams):
+            core.set_download_connections(concurrent_fragments, split_ranges, parallel_streams)
+        if self.transcode_var.get() != core.transcode:
+            core.set_transcode(self.transcode_var.get())
+        for mode, label in DUPLICATE_LABELS.items():
+            if label == self.duplicate_var.get() and mode != core.duplicate_mode:
+                core.set_duplicate_mode(mode)
+        for limit, label in BANDWIDTH_LABELS.items():
+            # Applies to downloads already running as well
+            if label == self.bandwidth_var.get() and limit != core.bandwidth.limit:
+                core.set_bandwidth_limits(limit=limit)
         self.destroy()
 
 class ReiDL(ctk.CTk):
@@ -200,9 +308,12 @@ class ReiDL(ctk.CTk):
         self.cached_video_formats = None
         self.cached_audio_formats = None
         self.url_base_id = None
+        self.current_job = None
+        self.current_collection = None
         
         self.core = ReiDLCore()
         self.load_settings()
+        mark_startup("core init")
         
         ctk.set_appearance_mode("dark")
         ctk.set_default_color_theme("blue")
@@ -211,14 +322,31 @@ class ReiDL(ctk.CTk):
         self.title("")
         self.geometry("800x250")
         self.resizable(False, False)
-        
-        self.setup_system_tray()
+        mark_startup("window create")
         
         if self.hotkey:
             keyboard.on_press_key(self.hotkey, self.on_hotkey)
         
         self.setup_window()
         self.setup_ui()
+        mark_startup("ui setup")
+        
+        self.after_idle(self.finish_startup)
+
+    def finish_startup(self):
+        """Runs once the window has been painted; loads the heavy modules in the background"""
+        self.update_idletasks()
+        mark_startup("first paint")
+        
+        def deferred():
+            self.setup_system_tray()
+            mark_startup("system tray (background)")
+            self.core.preload().join()
+            mark_startup("yt-dlp preload (background)")
+            self.resume_downloads()
+            report_startup()
+        
+        threading.Thread(target=deferred, daemon=True).start()
 
     def setup_window(self):
         try:
@@ -253,6 +381,8 @@ class ReiDL(ctk.CTk):
         self.protocol("WM_DELETE_WINDOW", self.on_close)
         
         if os.name == 'nt':
+            import win32gui
+            import win32con
             hwnd = self.winfo_id()
             style = win32gui.GetWindowLong(hwnd, win32con.GWL_STYLE)
             style |= win32con.WS_MINIMIZEBOX
@@ -273,6 +403,7 @@ class ReiDL(ctk.CTk):
         
         if hasattr(self, 'tray_icon'):
             self.tray_icon.stop()
+        self.core.close()
         self.quit()
 
     def setup_ui(self):
@@ -418,41 +549,36 @@ class ReiDL(ctk.CTk):
         if 'audio_quality_value' in kwargs:
             self.audio_quality_var.set(kwargs['audio_quality_value'])
 
-    def progress_hook(self, d):
-        if d['status'] == 'downloading':
-            try:
-                if 'filename' in d and self.core.current_download:
-                    self.core.current_download['partial_file'] = d['filename']
-                
-                total_bytes = d.get('total_bytes', 0) or d.get('total_bytes_estimate', 0)
-                downloaded_bytes = d.get('downloaded_bytes', 0)
-                
-                if downloaded_bytes > 0:
-                    if total_bytes > 0:
-                        percentage = (downloaded_bytes / total_bytes) * 100
-                        
-                        self.update_ui_safely(
-                            download_btn={
-                                'text': f"{percentage:.1f}%/{100}%",
-                                'state': "disabled",
-                                'fg_color': "#808080",
-                                'text_color': "white"
-                            },
-                            progress_label=f"Downloaded: {downloaded_bytes/1024/1024:.1f}MB / {total_bytes/1024/1024:.1f}MB"
-                        )
-                    else:
-                        self.update_ui_safely(
-                            download_btn={
-                                'text': f"Downloading...",
-                                'state': "disabled",
-                                'fg_color': "#808080",
-                                'text_color': "white"
-                            },
-                            progress_label=f"Downloaded: {downloaded_bytes/1024/1024:.1f}MB"
-                        )
-            except Exception as e:
-                if str(e) == "Download cancelled" or "cancelled" in str(e).lower():
-                    raise e
+    def progress_hook(self, snapshot):
+        if snapshot['status'] != 'downloading':
+            return
+        
+        total_bytes = snapshot['total_bytes']
+        downloaded_bytes = snapshot['downloaded_bytes']
+        speed = snapshot['speed']
+        speed_text = f" at {speed/1024/1024:.1f}MB/s" if speed else ""
+        
+        if downloaded_bytes > 0:
+            if total_bytes > 0:
+                self.update_ui_safely(
+                    download_btn={
+                        'text': f"{snapshot['percent']:.1f}%/{100}%",
+                        'state': "disabled",
+                        'fg_color': "#808080",
+                        'text_color': "white"
+                    },
+                    progress_label=f"Downloaded: {downloaded_bytes/1024/1024:.1f}MB / {total_bytes/1024/1024:.1f}MB{speed_text}"
+                )
+            else:
+                self.update_ui_safely(
+                    download_btn={
+                        'text': f"Downloading...",
+                        'state': "disabled",
+                        'fg_color': "#808080",
+                        'text_color': "white"
+                    },
+                    progress_label=f"Downloaded: {downloaded_bytes/1024/1024:.1f}MB{speed_text}"
+                )
 
     def on_url_change(self, event=None):
         if hasattr(self, '_url_check_after_id'):
@@ -513,6 +639,21 @@ class ReiDL(ctk.CTk):
                     }
                 )
                 self.update_quality_options()
+        elif url and get_collection_id(url):
+            # Playlists and channels are listed while downloading, so offer the generic ladder
+            if not self.get_busy():
+                self.update_ui_safely(
+                    video_quality={'values': COLLECTION_VIDEO_QUALITIES, 'state': "normal"},
+                    audio_quality={'values': COLLECTION_AUDIO_QUALITIES, 'state': "normal"},
+                    video_quality_value=COLLECTION_VIDEO_QUALITIES[2],
+                    audio_quality_value=COLLECTION_AUDIO_QUALITIES[0],
+                    download_btn={
+                        'text': "Download All",
+                        'state': "normal",
+                        'fg_color': "#2AAA8A"
+                    },
+                    progress_label="Playlist or channel: videos are queued as they are found."
+                )
         elif url:
             self.update_ui_safely(
                 download_btn={
@@ -704,59 +845,149 @@ class ReiDL(ctk.CTk):
         
         def download_thread():
             try:
-                success = self.core.start_download(
+                if not get_video_id(url) and get_collection_id(url):
+                    collection = self.core.queue_collection(url, video_quality, audio_quality)
+                    self.await_collection(collection)
+                    return
+                
+                job = self.core.queue_download(
                     url, video_quality, audio_quality,
                     progress_callback=self.progress_hook
                 )
+                if not job:
+                    raise ValueError("Unsupported URL")
                 
-                if success and not self.core.current_download['cancelled']:
-                    self.update_ui_safely(
-                        download_btn={
-                            'text': "Download completed!",
-                            'state': "disabled",
-                            'fg_color': "#2AAA8A",
-                            'text_color': "white"
-                        },
-                        progress_label="Download completed successfully!"
-                    )
-                else:
-                    message = "Download cancelled" if self.core.current_download['cancelled'] else "Download failed"
-                    self.update_ui_safely(
-                        download_btn={
-                            'text': "Error" if not self.core.current_download['cancelled'] else "Cancelled",
-                            'state': "disabled",
-                            'fg_color': "#FF6B6B",
-                            'text_color': "white"
-                        },
-                        progress_label=message
-                    )
+                self.await_download(job)
             except Exception as e:
-                self.update_ui_safely(
-                    download_btn={
-                        'text': "Error",
-                        'state': "disabled",
-                        'fg_color': "#FF6B6B",
-                        'text_color': "white"
-                    },
-                    progress_label=f"Error: {str(e)}"
-                )
+                self.show_download_error(e)
             finally:
-                self.pause_btn.configure(state="disabled")
-                self.cancel_btn.configure(state="disabled")
-                
-                self.after(10, lambda: self.set_busy(False))
-                
-                self.after(2000, self.reset_controls)
+                self.download_finished()
         
         thread = threading.Thread(target=download_thread, daemon=True)
         thread.start()
 
+    def await_download(self, job):
+        self.current_job = job
+        success = job.wait()
+        
+        if success and not job.cancelled:
+            self.update_ui_safely(
+                download_btn={
+                    'text': "Download completed!",
+                    'state': "disabled",
+                    'fg_color': "#2AAA8A",
+                    'text_color': "white"
+                },
+                progress_label=(f"Already downloaded: {job.output_path}" if job.duplicate_of
+                                else "Download completed successfully!")
+            )
+        else:
+            message = "Download cancelled and temporary files removed." if job.cancelled else "Download failed"
+            self.update_ui_safely(
+                download_btn={
+                    'text': "Error" if not job.cancelled else "Cancelled",
+                    'state': "disabled",
+                    'fg_color': "#FF6B6B",
+                    'text_color': "white"
+                },
+                progress_label=message
+            )
+
+    def await_collection(self, collection):
+        self.current_collection = collection
+        completed = 0
+        index = 0
+        try:
+            while index < len(collection.jobs) or not collection.done:
+                if index >= len(collection.jobs):
+                    collection.wait(0.2)
+                    continue
+                
+                # Follow the videos in queue order, the others keep downloading in the background
+                job = collection.jobs[index]
+                index += 1
+                self.current_job = job
+                job.progress_callback = self.progress_hook
+                found = len(collection.jobs)
+                self.update_ui_safely(
+                    progress_label=f"Video {index} of {found}{'' if collection.done else '+'}..."
+                )
+                if job.wait():
+                    completed += 1
+        finally:
+            self.current_collection = None
+        
+        if collection.error:
+            raise Exception(collection.error)
+        
+        cancelled = collection.cancelled
+        self.update_ui_safely(
+            download_btn={
+                'text': "Cancelled" if cancelled else "Download completed!",
+                'state': "disabled",
+                'fg_color': "#FF6B6B" if cancelled else "#2AAA8A",
+                'text_color': "white"
+            },
+            progress_label=f"Downloaded {completed} of {len(collection.jobs)} videos."
+        )
+
+    def show_download_error(self, e):
+        self.update_ui_safely(
+            download_btn={
+                'text': "Error",
+                'state': "disabled",
+                'fg_color': "#FF6B6B",
+                'text_color': "white"
+            },
+            progress_label=f"Error: {str(e)}"
+        )
+
+    def download_finished(self):
+        self.pause_btn.configure(state="disabled")
+        self.cancel_btn.configure(state="disabled")
+        
+        self.after(10, lambda: self.set_busy(False))
+        
+        self.after(2000, self.reset_controls)
+
+    def resume_downloads(self):
+        jobs = self.core.resume_jobs()
+        if not jobs:
+            return
+        
+        job = jobs[0]
+        job.progress_callback = self.progress_hook
+        
+        def resume_thread():
+            try:
+                self.await_download(job)
+            except Exception as e:
+                self.show_download_error(e)
+            finally:
+                self.download_finished()
+        
+        def show():
+            self.set_busy(True)
+            self.update_ui_safely(
+                download_btn={
+                    'text': "Resuming download...",
+                    'state': "disabled",
+                    'fg_color': "#808080"
+                },
+                progress_label=f"Resuming {len(jobs)} interrupted download(s)..."
+            )
+            self.pause_btn.configure(state="normal")
+            self.cancel_btn.configure(state="normal")
+            threading.Thread(target=resume_thread, daemon=True).start()
+        
+        self.after(0, show)
+
     def toggle_pause(self):
-        if not self.core.current_download:
+        if not self.current_job or self.current_job.done:
             print("No active download to pause/resume")
             return False
             
-        is_paused = self.core.toggle_pause()
+        is_paused = self.core.toggle_pause(self.current_job)
         print(f"Download {'paused' if is_paused else 'resumed'}")
         
         if is_paused:
@@ -788,24 +1019,13 @@ class ReiDL(ctk.CTk):
             progress_label="Cancelling download and cleaning up files..."
         )
         
-        if self.core.cancel_download():
+        if self.current_collection:
+            cancelled = self.core.cancel_collection(self.current_collection)
+        else:
+            cancelled = self.core.cancel_download(self.current_job)
+        
+        if cancelled:
             self.set_busy(False)
-            
-            self.after(100, lambda: self.update_ui_safely(
-                progress_label="Removing partial download files..."
-            ))
-            
-            self.after(2000, lambda: self.update_ui_safely(
-                download_btn={
-                    'text': "Cancelled",
-                    'state': "disabled",
-                    'fg_color': "#FF6B6B",
-                    'text_color': "white"
-                },
-                progress_label="Download cancelled and temporary files removed."
-            ))
-            
-            self.after(4000, self.reset_controls)
         else:
             self.update_ui_safely(
                 download_btn={
@@ -860,51 +1080,34 @@ class ReiDL(ctk.CTk):
             self.location_label.configure(text=f"Save to: {path}")
 
     def load_settings(self):
-        try:
-            with open('config.json', 'r') as f:
-                config = json.load(f)
-                
-                self.hotkey_data = config.get('hotkey_data')
-                
-                if not self.hotkey_data and 'hotkey' in config:
-                    old_hotkey = config.get('hotkey')
-                    if old_hotkey:
-                        self.hotkey_data = {
-                            'name': old_hotkey,
-                            'scan_code': None
-                        }
-                
-                if isinstance(self.hotkey_data, dict) and 'name' in self.hotkey_data:
-                    self.hotkey = self.hotkey_data['name']
-                else:
-                    self.hotkey_data = None
-                    self.hotkey = None
-                    
-        except (FileNotFoundError, json.JSONDecodeError):
+        config = self.core.config
+        self.hotkey_data = config.get('hotkey_data')
+        
+        if not self.hotkey_data:
+            old_hotkey = config.get('hotkey')
+            if old_hotkey:
+                self.hotkey_data = {
+                    'name': old_hotkey,
+                    'scan_code': None
+                }
+        
+        if isinstance(self.hotkey_data, dict) and 'name' in self.hotkey_data:
+            self.hotkey = self.hotkey_data['name']
+        else:
             self.hotkey_data = None
             self.hotkey = None
 
     def save_settings(self):
-        config = {}
-        try:
-            with open('config.json', 'r') as f:
-                config = json.load(f)
-        except:
-            pass
-        
-        config.pop('hotkey', None)
-        config.pop('original_hotkey', None)
+        config = self.core.config
+        config.delete('hotkey', 'original_hotkey')
         
         if self.hotkey_data:
-            config['hotkey_data'] = {
+            config.set('hotkey_data', {
                 'name': self.hotkey_data['name'],
                 'scan_code': self.hotkey_data.get('scan_code')
-            }
+            })
         else:
-            config.pop('hotkey_data', None)
-        
-        with open('config.json', 'w') as f:
-            json.dump(config, f)
+            config.delete('hotkey_data')
 
     def set_hotkey(self, hotkey_data):
         if hotkey_data is None:
@@ -944,7 +1147,7 @@ class ReiDL(ctk.CTk):
             is_busy = self.get_busy()
             downloading = is_busy and hasattr(self, 'download_btn') and 'Downloading' in self.download_btn.cget('text')
             
-            if downloading and not self.core.current_download['paused']:
+            if downloading and self.current_job and not self.current_job.paused:
                 return
             
             if self.hotkey_data and 'scan_code' in self.hotkey_data and self.hotkey_data['scan_code']:
@@ -963,17 +1166,21 @@ class ReiDL(ctk.CTk):
 
     def _ensure_topmost(self):
         if self.state() != 'withdrawn':
-            hwnd = self.winfo_id()
-            rect = win32gui.GetWindowRect(hwnd)
-            x, y, w, h = rect[0], rect[1], rect[2] - rect[0], rect[3] - rect[1]
-            win32gui.SetWindowPos(hwnd, win32con.HWND_TOPMOST, x, y, w, h, 
-                                win32con.SWP_SHOWWINDOW)
+            if os.name == 'nt':
+                import win32gui
+                import win32con
+                hwnd = self.winfo_id()
+                rect = win32gui.GetWindowRect(hwnd)
+                x, y, w, h = rect[0], rect[1], rect[2] - rect[0], rect[3] - rect[1]
+                win32gui.SetWindowPos(hwnd, win32con.HWND_TOPMOST, x, y, w, h, 
+                                    win32con.SWP_SHOWWINDOW)
             self.focus_force()
             self.attributes('-topmost', True)
 
     def setup_system_tray(self):
         icon_path = os.path.join(os.path.dirname(__file__), "reidl.png")
         if os.path.exists(icon_path):
+            import pystray
             icon = Image.open(icon_path)
             menu = (pystray.MenuItem("Show", self.show_window),
                    pystray.MenuItem("Exit", self.quit_app))
@@ -984,6 +1191,7 @@ class ReiDL(ctk.CTk):
     def quit_app(self, icon=None, item=None):
         if hasattr(self, 'tray_icon'):
             self.tray_icon.stop()
+        self.core.close()
         self.quit()
 
     def open_settings(self):
@@ -1026,5 +1234,6 @@ class ReiDL(ctk.CTk):
         )
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
     app = ReiDL()
     app.mainloop() 
\ No newline at end of file
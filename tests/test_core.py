@@ -0,0 +1,152 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reidl_config import ConfigStore
+from reidl_core import INFO_CACHE_SIZE, INFO_CLAIM_LIMIT, BandwidthManager, DownloadJob, ReiDLCore, get_video_id
+
+URL = 'https://www.youtube.com/watch?v=abcdefghijk'
+
+class DownloadJobFinishTest(unittest.TestCase):
+    def test_wait_covers_done_callback(self):
+        called = []
+
+        def on_done(job):
+            time.sleep(0.1)
+            called.append(job.status)
+
+        job = DownloadJob(URL, 'best', 'best', done_callback=on_done)
+        threading.Thread(target=job.finish, args=('completed',), kwargs={'success': True}).start()
+
+        self.assertTrue(job.wait(5))
+        self.assertEqual(called, ['completed'])
+
+    def test_finish_runs_callback_once(self):
+        called = []
+        job = DownloadJob(URL, 'best', 'best', done_callback=lambda job: called.append(job.status))
+        job.finish('completed', success=True)
+        job.finish('failed', error='late')
+
+        self.assertEqual(called, ['completed'])
+        self.assertEqual(job.status, 'completed')
+
+class BandwidthManagerTest(unittest.TestCase):
+    def test_resumed_bytes_are_not_charged(self):
+        manager = BandwidthManager(limit=2 * 1024 * 1024)
+        job = DownloadJob(URL, 'best', 'best')
+        d = {'filename': 'video.mp4', 'downloaded_bytes': 3 * 1024 ** 3}
+
+        started = time.monotonic()
+        manager.throttle(job, d)
+        manager.throttle(job, dict(d, downloaded_bytes=d['downloaded_bytes'] + 1024))
+
+        self.assertLess(time.monotonic() - started, 1)
+
+class ReiDLCoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.env = {name: os.environ.get(name) for name in ('XDG_DATA_HOME', 'XDG_CACHE_HOME', 'XDG_CONFIG_HOME')}
+        for name in self.env:
+            os.environ[name] = self.tmp
+
+        self.config = ConfigStore(os.path.join(self.tmp, 'config.json'))
+        self.config.set('download_path', self.tmp)
+
+    def tearDown(self):
+        self.config.flush()
+        for name, value in self.env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def make_core(self):
+        core = ReiDLCore(config=self.config)
+        self.addCleanup(core.close)
+        return core
+
+    def test_transcodes_ignore_platform_limits(self):
+        workers = 6
+        self.config.set('transcode_workers', workers)
+        core = self.make_core()
+        barrier = threading.Barrier(workers, timeout=5)
+
+        def run(job):
+            try:
+                barrier.wait()
+                job.finish('completed', success=True)
+            except threading.BrokenBarrierError:
+                job.finish('failed', error='transcodes did not run concurrently')
+
+        core.transcodes.runner = run
+        jobs = [core.transcodes.submit(DownloadJob(URL, 'best', 'best')) for _ in range(workers)]
+
+        for job in jobs:
+            self.assertTrue(job.wait(10), job.error)
+
+    def test_playlist_results_keep_plain_download_path(self):
+        core = self.make_core()
+        job = DownloadJob('https://x.com/user/status/123', 'Best Quality', 'Original Audio')
+        entry = {'id': '123', 'title': 'clip', 'extractor': 'twitter', 'extractor_key': 'Twitter',
+                 'webpage_url': 'https://x.com/user/status/123',
+                 'formats': [{'format_id': 'http-832', 'url': 'http://127.0.0.1/clip.mp4', 'ext': 'mp4',
+                              'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 720}]}
+        info = {'_type': 'playlist', 'id': '123', 'title': 'tweet', 'extractor': 'twitter',
+                'extractor_key': 'Twitter', 'webpage_url': 'https://x.com/user/status/123',
+                'entries': [dict(entry, id='1'), dict(entry, id='2')]}
+        job.output_path = os.path.join(self.tmp, 'x.mp4')
+
+        with core.ydl_pool.checkout('download', 'twitter') as ydl:
+            self.assertIsNone(core._plan_postprocessing(ydl, job, info))
+        self.assertIsNone(job.plan)
+
+    def test_prefetch_reports_lookup_error_class(self):
+        self.config.set('retry_policies', {'network': {'attempts': 0}})
+        core = self.make_core()
+        core.format_cache = None
+
+        def fail(url, video_info):
+            raise Exception("Connection reset by peer")
+
+        core._extract_video_formats = fail
+        results = list(core.prefetch_formats([URL]))
+
+        self.assertEqual(results, [(URL, None, None, 'network')])
+
+    def test_queued_job_keeps_prefetched_info(self):
+        core = self.make_core()
+        job = DownloadJob(URL, 'best', 'best')
+        core._remember_info(job.video_info, {'id': 'abcdefghijk'})
+        core._claim_info(job)
+
+        for index in range(INFO_CACHE_SIZE + 1):
+            url = f'https://www.youtube.com/watch?v={index:011d}'
+            core._remember_info(get_video_id(url), {'id': f'{index:011d}'})
+
+        self.assertEqual(core._take_info(job), {'id': 'abcdefghijk'})
+        self.assertIsNone(job.prefetched_info)
+
+    def test_claimed_info_is_capped(self):
+        core = self.make_core()
+        jobs = []
+        for index in range(INFO_CLAIM_LIMIT + 1):
+            job = DownloadJob(f'https://www.youtube.com/watch?v={index:011d}', 'best', 'best')
+            core._remember_info(job.video_info, {'id': f'{index:011d}'})
+            core._claim_info(job)
+            jobs.append(job)
+
+        self.assertIsNone(jobs[-1].prefetched_info)
+        self.assertEqual(core._take_info(jobs[-1]), {'id': f'{INFO_CLAIM_LIMIT:011d}'})
+
+        core._release_info(jobs[0])
+        self.assertEqual(core._claimed_info, INFO_CLAIM_LIMIT - 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,18 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reidl_formats import FormatTable
+
+class FormatTableTest(unittest.TestCase):
+    def test_missing_text_columns_are_empty_strings(self):
+        table = FormatTable({'format_id': ['137', '140'], 'height': [1080, 0]})
+
+        for name in FormatTable.TEXT_COLUMNS[1:]:
+            self.assertEqual(getattr(table, name), ['', ''])
+        self.assertEqual(list(table.size), [0, 0])
+
+if __name__ == '__main__':
+    unittest.main()
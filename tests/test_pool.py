@@ -0,0 +1,57 @@
+import os
+import sys
+import types
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reidl_core import ReiDLCore, YoutubeDLPool
+
+FORMATS = [
+    {'format_id': '242', 'url': 'http://127.0.0.1/242', 'ext': 'webm', 'vcodec': 'vp9',
+     'acodec': 'none', 'height': 240, 'width': 426, 'tbr': 200},
+    {'format_id': '248', 'url': 'http://127.0.0.1/248', 'ext': 'webm', 'vcodec': 'vp9',
+     'acodec': 'none', 'height': 1080, 'width': 1920, 'tbr': 3000},
+    {'format_id': '251', 'url': 'http://127.0.0.1/251', 'ext': 'webm', 'vcodec': 'none',
+     'acodec': 'opus', 'abr': 160, 'tbr': 160},
+]
+
+def make_info():
+    return {
+        'id': 'abcdefghijk',
+        'title': 'test',
+        'extractor': 'youtube',
+        'extractor_key': 'Youtube',
+        'webpage_url': 'https://www.youtube.com/watch?v=abcdefghijk',
+        'formats': [dict(f) for f in FORMATS],
+    }
+
+class YoutubeDLPoolFormatTest(unittest.TestCase):
+    def setUp(self):
+        settings = types.SimpleNamespace(split_ranges=False, concurrent_fragments=1)
+        self.pool = YoutubeDLPool(lambda profile, platform: ReiDLCore._ydl_options(settings, profile, platform))
+
+    def tearDown(self):
+        self.pool.close()
+
+    def select(self, format=None):
+        with self.pool.checkout('download', 'youtube', format=format) as ydl:
+            return ydl.process_ie_result(make_info(), download=False)['format_id']
+
+    def test_checkout_uses_requested_format(self):
+        self.assertEqual(self.select('bestvideo[height<=240]+bestaudio/best[height<=240]/best'), '242+251')
+
+    def test_reused_instance_does_not_keep_previous_format(self):
+        self.select('bestvideo[height<=240]+bestaudio/best')
+        self.assertEqual(self.select(), '248+251')
+
+    def test_reused_instance_does_not_keep_previous_outtmpl(self):
+        with self.pool.checkout('download', 'youtube', outtmpl='/tmp/job1.mp4') as ydl:
+            self.assertEqual(ydl.params['outtmpl']['default'], '/tmp/job1.mp4')
+            first = ydl
+        with self.pool.checkout('download', 'youtube') as ydl:
+            self.assertIs(ydl, first)
+            self.assertNotEqual(ydl.params['outtmpl']['default'], '/tmp/job1.mp4')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HAS_UI = all(importlib.util.find_spec(name) for name in ('customtkinter', 'keyboard', 'PIL'))
+HAS_DISPLAY = sys.platform in ('win32', 'darwin') or bool(os.environ.get('DISPLAY'))
+
+@unittest.skipUnless(HAS_UI and HAS_DISPLAY, "needs customtkinter, keyboard, Pillow and a display")
+class SettingsWindowTest(unittest.TestCase):
+    def setUp(self):
+        import customtkinter as ctk
+        from reidl_config import ConfigStore
+        from reidl_core import ReiDLCore
+
+        self.tmp = tempfile.mkdtemp()
+        self.env = {name: os.environ.get(name) for name in ('XDG_DATA_HOME', 'XDG_CACHE_HOME', 'XDG_CONFIG_HOME')}
+        for name in self.env:
+            os.environ[name] = self.tmp
+
+        self.root = ctk.CTk()
+        self.root.hotkey = None
+        self.root.core = ReiDLCore(config=ConfigStore(os.path.join(self.tmp, 'config.json')))
+
+    def tearDown(self):
+        self.root.core.close()
+        self.root.destroy()
+        for name, value in self.env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_opens_with_default_config(self):
+        from reidl_ui import BANDWIDTH_LABELS, SettingsWindow
+
+        self.assertIsNone(self.root.core.bandwidth.limit)
+        window = SettingsWindow(self.root)
+        self.assertEqual(window.bandwidth_var.get(), BANDWIDTH_LABELS[None])
+        window.destroy()
+
+if __name__ == '__main__':
+    unittest.main()